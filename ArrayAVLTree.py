@@ -0,0 +1,626 @@
+"""
+An AVL tree engine that keeps its nodes in parallel columns.
+
+Instead of one Python object per node, every node is an integer index into
+a set of columns (keys, values, left, right, parent, height, size) held by
+an _ArrayStore. Index 0 is the virtual node. Deleted slots are kept on a
+free list and reused by later inserts.
+
+ArrayAVLTree exposes the same operations as AVLTree. The nodes it hands out
+are ArrayAVLNode handles (a store and an index) rather than AVLNode objects.
+A handle stays valid until its node is deleted.
+"""
+
+from array import array
+
+VIRTUAL = 0
+
+
+class ArrayAVLNode(object):
+    """A handle to a node of an ArrayAVLTree.
+
+    @type store: _ArrayStore
+    @param store: the columns the node lives in
+    @type index: int
+    @param index: the index of the node in the columns
+    """
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, ArrayAVLNode) and self.store is other.store and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    @property
+    def key(self):
+        return self.store.keys[self.index]
+
+    @property
+    def value(self):
+        return self.store.values[self.index]
+
+    @property
+    def height(self):
+        return self.store.height[self.index]
+
+    @property
+    def left(self):
+        return ArrayAVLNode(self.store, self.store.left[self.index])
+
+    @property
+    def right(self):
+        return ArrayAVLNode(self.store, self.store.right[self.index])
+
+    @property
+    def parent(self):
+        parent = self.store.parent[self.index]
+        if parent == VIRTUAL:
+            return None
+        return ArrayAVLNode(self.store, parent)
+
+    def is_real_node(self):
+        """returns whether self is not a virtual node
+
+        @rtype: bool
+        @returns: False if self is a virtual node, True otherwise.
+        """
+        return self.index != VIRTUAL
+
+
+class _ArrayStore(object):
+    """The columns shared by all the trees that can exchange nodes (join, split)"""
+
+    def __init__(self):
+        self.keys = [None]
+        self.values = [None]
+        self.left = array("i", [VIRTUAL])
+        self.right = array("i", [VIRTUAL])
+        self.parent = array("i", [VIRTUAL])
+        self.height = array("b", [-1])
+        self.size = array("i", [0])
+        self.free = []
+
+    def alloc(self, key, val):
+        """returns the index of a new leaf holding key and val"""
+        if self.free:
+            index = self.free.pop()
+            self.keys[index] = key
+            self.values[index] = val
+            self.left[index] = VIRTUAL
+            self.right[index] = VIRTUAL
+            self.parent[index] = VIRTUAL
+            self.height[index] = 0
+            self.size[index] = 1
+            return index
+
+        self.keys.append(key)
+        self.values.append(val)
+        self.left.append(VIRTUAL)
+        self.right.append(VIRTUAL)
+        self.parent.append(VIRTUAL)
+        self.height.append(0)
+        self.size.append(1)
+        return len(self.keys) - 1
+
+    def release(self, index):
+        self.keys[index] = None
+        self.values[index] = None
+        self.free.append(index)
+
+    # ==================== STRUCTURE HELPERS =============================
+
+    def update(self, node):
+        left, right, height = self.left, self.right, self.height
+        lh = height[left[node]]
+        rh = height[right[node]]
+        height[node] = (lh if lh > rh else rh) + 1
+        self.size[node] = self.size[left[node]] + self.size[right[node]] + 1
+
+    def replace_child(self, parent, old, new):
+        if parent != VIRTUAL:
+            if self.left[parent] == old:
+                self.left[parent] = new
+            else:
+                self.right[parent] = new
+        if new != VIRTUAL:
+            self.parent[new] = parent
+
+    def rotate_left(self, node):
+        left, right, parent = self.left, self.right, self.parent
+        child = right[node]
+        self.replace_child(parent[node], node, child)
+        right[node] = left[child]
+        if left[child] != VIRTUAL:
+            parent[left[child]] = node
+        left[child] = node
+        parent[node] = child
+        self.update(node)
+        self.update(child)
+        return child
+
+    def rotate_right(self, node):
+        left, right, parent = self.left, self.right, self.parent
+        child = left[node]
+        self.replace_child(parent[node], node, child)
+        left[node] = right[child]
+        if right[child] != VIRTUAL:
+            parent[right[child]] = node
+        right[child] = node
+        parent[node] = child
+        self.update(node)
+        self.update(child)
+        return child
+
+    def balance(self, node):
+        """updates node and rotates it if it is out of balance, returns the top of its subtree"""
+        left, right, height = self.left, self.right, self.height
+        self.update(node)
+        bf = height[left[node]] - height[right[node]]
+
+        if bf == 2:
+            child = left[node]
+            if height[left[child]] < height[right[child]]:
+                self.rotate_left(child)
+            return self.rotate_right(node)
+
+        if bf == -2:
+            child = right[node]
+            if height[right[child]] < height[left[child]]:
+                self.rotate_right(child)
+            return self.rotate_left(node)
+
+        return node
+
+    def fix_up(self, node, root):
+        """rebalances from node up, stops once a subtree height is unchanged, returns the root"""
+        parent, height = self.parent, self.height
+        while node != VIRTUAL:
+            old_height = height[node]
+            top = self.balance(node)
+            if parent[top] == VIRTUAL:
+                return top
+            if height[top] == old_height:
+                return root
+            node = parent[top]
+        return root
+
+    def join(self, left_root, node, right_root):
+        """joins two subtrees with the separating node, returns the root of the result"""
+        left, right, parent, height, size = self.left, self.right, self.parent, self.height, self.size
+        h_left = height[left_root]
+        h_right = height[right_root]
+
+        if abs(h_left - h_right) <= 1:
+            left[node] = left_root
+            right[node] = right_root
+            parent[node] = VIRTUAL
+            if left_root != VIRTUAL:
+                parent[left_root] = node
+            if right_root != VIRTUAL:
+                parent[right_root] = node
+            self.update(node)
+            return node
+
+        if h_left > h_right:
+            added = size[right_root] + 1
+            current = left_root
+            while height[right[current]] > h_right:
+                size[current] += added
+                current = right[current]
+            size[current] += added
+            left[node] = right[current]
+            right[node] = right_root
+            right[current] = node
+        else:
+            added = size[left_root] + 1
+            current = right_root
+            while height[left[current]] > h_left:
+                size[current] += added
+                current = left[current]
+            size[current] += added
+            right[node] = left[current]
+            left[node] = left_root
+            left[current] = node
+
+        parent[node] = current
+        if left[node] != VIRTUAL:
+            parent[left[node]] = node
+        if right[node] != VIRTUAL:
+            parent[right[node]] = node
+        self.update(node)
+
+        root = left_root if h_left > h_right else right_root
+        return self.fix_up(current, root)
+
+    def build(self, items, start, end):
+        """builds a balanced subtree from the sorted items[start:end], returns its root"""
+        if start >= end:
+            return VIRTUAL
+        mid = (start + end) // 2
+        key, val = items[mid]
+        node = self.alloc(key, val)
+        left_root = self.build(items, start, mid)
+        right_root = self.build(items, mid + 1, end)
+        self.left[node] = left_root
+        self.right[node] = right_root
+        if left_root != VIRTUAL:
+            self.parent[left_root] = node
+        if right_root != VIRTUAL:
+            self.parent[right_root] = node
+        self.update(node)
+        return node
+
+    def rightmost(self, node):
+        right = self.right
+        while right[node] != VIRTUAL:
+            node = right[node]
+        return node
+
+
+"""
+A class implementing an AVL tree over integer-indexed columns.
+"""
+
+
+class ArrayAVLTree(object):
+    """
+    Constructor.
+
+    @type store: _ArrayStore
+    @param store: columns to allocate the nodes in, a new store if None
+    """
+
+    def __init__(self, store=None):
+        self._store = _ArrayStore() if store is None else store
+        self._root = VIRTUAL
+        self._max = VIRTUAL
+
+    def _handle(self, index):
+        if index == VIRTUAL:
+            return None
+        return ArrayAVLNode(self._store, index)
+
+    def search(self, key):
+        """searches for a node in the dictionary corresponding to the key (starting at the root)
+
+        @type key: int
+        @param key: a key to be searched
+        @rtype: (ArrayAVLNode,int)
+        @returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
+        and e is the number of edges on the path between the starting node and ending node+1.
+        """
+        store = self._store
+        keys, left, right = store.keys, store.left, store.right
+        node = self._root
+        if node == VIRTUAL:
+            return None, 0
+
+        arcs = 1
+        while True:
+            node_key = keys[node]
+            if node_key == key:
+                return ArrayAVLNode(store, node), arcs
+            node = left[node] if key < node_key else right[node]
+            if node == VIRTUAL:
+                return None, arcs
+            arcs += 1
+
+    def finger_search(self, key):
+        """searches for a node in the dictionary corresponding to the key, starting at the max
+
+        @type key: int
+        @param key: a key to be searched
+        @rtype: (ArrayAVLNode,int)
+        @returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
+        and e is the number of edges on the path between the starting node and ending node+1.
+        """
+        store = self._store
+        keys, left, right, parent = store.keys, store.left, store.right, store.parent
+        node = self._max
+        if node == VIRTUAL:
+            return None, 1
+
+        arcs = 1
+        # ======== Traverse Up ======================
+        while node != self._root:
+            if keys[node] == key:
+                return ArrayAVLNode(store, node), arcs
+            if key <= keys[parent[node]]:
+                node = parent[node]
+            else:
+                break
+            arcs += 1
+
+        # ======== Traverse down ======================
+        while True:
+            node_key = keys[node]
+            if node_key == key:
+                return ArrayAVLNode(store, node), arcs
+            node = left[node] if key < node_key else right[node]
+            if node == VIRTUAL:
+                return None, arcs
+            arcs += 1
+
+    def insert(self, key, val):
+        """inserts a new node into the dictionary with corresponding key and value, starting at the root
+
+        @type key: int
+        @pre: key currently does not appear in the dictionary
+        @param key: key of item that is to be inserted to self
+        @type val: string
+        @param val: the value of the item
+        @rtype: (ArrayAVLNode,int,int)
+        @returns: a 3-tuple (x,e,h) where x is the new node,
+        e is the number of edges on the path between the starting node and new node before rebalancing,
+        and h is the number of PROMOTE cases during the AVL rebalancing
+        """
+        return self._insert_from(self._root, 0, key, val)
+
+    def finger_insert(self, key, val):
+        """inserts a new node into the dictionary with corresponding key and value, starting at the max
+
+        @type key: int
+        @pre: key currently does not appear in the dictionary
+        @param key: key of item that is to be inserted to self
+        @type val: string
+        @param val: the value of the item
+        @rtype: (ArrayAVLNode,int,int)
+        @returns: a 3-tuple (x,e,h) where x is the new node,
+        e is the number of edges on the path between the starting node and new node before rebalancing,
+        and h is the number of PROMOTE cases during the AVL rebalancing
+        """
+        keys, parent = self._store.keys, self._store.parent
+        arcs = 0
+        node = self._max
+        if node != VIRTUAL:
+            while node != self._root and key < keys[parent[node]]:
+                node = parent[node]
+                arcs += 1
+        return self._insert_from(node, arcs, key, val)
+
+    def delete(self, node):
+        """deletes node from the dictionary
+
+        @type node: ArrayAVLNode
+        @pre: node is a real pointer to a node in self
+        """
+        store = self._store
+        left, right, parent, height, size = store.left, store.right, store.parent, store.height, store.size
+        z = node.index
+
+        # the new max is the predecessor of the old one: its left leaf or its parent
+        if z == self._max:
+            self._max = left[z] if left[z] != VIRTUAL else parent[z]
+
+        if left[z] == VIRTUAL or right[z] == VIRTUAL:
+            removed_parent = parent[z]
+            child = left[z] if left[z] != VIRTUAL else right[z]
+            self._shrink_sizes(removed_parent)
+            self._transplant(z, child)
+            start = removed_parent
+        else:
+            successor = right[z]
+            while left[successor] != VIRTUAL:
+                successor = left[successor]
+            self._shrink_sizes(parent[successor])
+
+            if parent[successor] == z:
+                start = successor
+            else:
+                start = parent[successor]
+                self._transplant(successor, right[successor])
+                right[successor] = right[z]
+                parent[right[successor]] = successor
+
+            self._transplant(z, successor)
+            left[successor] = left[z]
+            parent[left[successor]] = successor
+            height[successor] = height[z]
+            size[successor] = size[z]
+
+        self._root = store.fix_up(start, self._root)
+        store.release(z)
+
+    def join(self, tree2, key, val):
+        """joins self with item and another ArrayAVLTree
+
+        @type tree2: ArrayAVLTree
+        @param tree2: a dictionary to be joined with self
+        @type key: int
+        @param key: the key separting self and tree2
+        @type val: string
+        @param val: the value corresponding to key
+        @pre: all keys in self are smaller than key and all keys in tree2 are larger than key,
+        or the opposite way
+        """
+        store = self._store
+        if tree2._store is not store:
+            # the nodes of tree2 have to be copied into our columns first, O(|tree2|)
+            items = tree2.avl_to_array()
+            tree2 = ArrayAVLTree(store)
+            tree2._root = store.build(items, 0, len(items))
+            tree2._max = store.rightmost(tree2._root) if items else VIRTUAL
+
+        if self._root != VIRTUAL:
+            self_is_left = store.keys[self._root] < key
+        else:
+            self_is_left = tree2._root == VIRTUAL or store.keys[tree2._root] > key
+        left_tree, right_tree = (self, tree2) if self_is_left else (tree2, self)
+
+        node = store.alloc(key, val)
+        new_max = right_tree._max if right_tree._root != VIRTUAL else node
+        self._root = store.join(left_tree._root, node, right_tree._root)
+        self._max = new_max
+
+    def split(self, node):
+        """splits the dictionary at a given node
+
+        @type node: ArrayAVLNode
+        @pre: node is in self
+        @param node: the node in the dictionary to be used for the split
+        @rtype: (ArrayAVLTree, ArrayAVLTree)
+        @returns: a tuple (left, right), where left is an ArrayAVLTree representing the keys in the
+        dictionary smaller than node.key, and right is an ArrayAVLTree representing the keys in the
+        dictionary larger than node.key.
+        """
+        store = self._store
+        left, right, parent = store.left, store.right, store.parent
+        x = node.index
+
+        left_tree = ArrayAVLTree(store)
+        right_tree = ArrayAVLTree(store)
+        left_tree._max = self._predecessor(x)
+        if x != self._max:
+            right_tree._max = self._max
+
+        left_root = left[x]
+        right_root = right[x]
+        parent[left_root] = VIRTUAL
+        parent[right_root] = VIRTUAL
+
+        current = x
+        up = parent[x]
+        while up != VIRTUAL:
+            next_up = parent[up]
+            if right[up] == current:
+                subtree = left[up]
+                parent[subtree] = VIRTUAL
+                left_root = store.join(subtree, up, left_root)
+            else:
+                subtree = right[up]
+                parent[subtree] = VIRTUAL
+                right_root = store.join(right_root, up, subtree)
+            current = up
+            up = next_up
+
+        left_tree._root = left_root
+        right_tree._root = right_root
+        store.release(x)
+        self._root = VIRTUAL
+        self._max = VIRTUAL
+
+        return left_tree, right_tree
+
+    def avl_to_array(self):
+        """returns an array representing dictionary
+        @rtype: list
+        @returns: a sorted list according to key of touples (key, value) representing the data structure
+        """
+        store = self._store
+        keys, values, left, right = store.keys, store.values, store.left, store.right
+        result = []
+        stack = []
+        node = self._root
+        while stack or node != VIRTUAL:
+            while node != VIRTUAL:
+                stack.append(node)
+                node = left[node]
+            node = stack.pop()
+            result.append((keys[node], values[node]))
+            node = right[node]
+        return result
+
+    def max_node(self):
+        """returns the node with the maximal key in the dictionary
+        @rtype: ArrayAVLNode
+        @returns: the maximal node, None if the dictionary is empty
+        """
+        return self._handle(self._max)
+
+    def size(self):
+        """returns the number of items in dictionary
+        @rtype: int
+        @returns: the number of items in dictionary
+        """
+        return self._store.size[self._root]
+
+    def get_root(self):
+        return self._handle(self._root)
+
+    # ==================== HELPER FUNCTIONS =============================
+
+    def _insert_from(self, start, arcs, key, val):
+        store = self._store
+        keys, left, right, parent, height, size = (
+            store.keys,
+            store.left,
+            store.right,
+            store.parent,
+            store.height,
+            store.size,
+        )
+        x = store.alloc(key, val)
+
+        if self._root == VIRTUAL:
+            self._root = x
+            self._max = x
+            return ArrayAVLNode(store, x), 0, 0
+
+        # simple insertion
+        node = start
+        while True:
+            arcs += 1
+            if key > keys[node]:
+                if right[node] == VIRTUAL:
+                    right[node] = x
+                    break
+                node = right[node]
+            else:
+                if left[node] == VIRTUAL:
+                    left[node] = x
+                    break
+                node = left[node]
+        parent[x] = node
+
+        if key > keys[self._max]:
+            self._max = x
+
+        iter_node = node
+        while iter_node != VIRTUAL:
+            size[iter_node] += 1
+            iter_node = parent[iter_node]
+
+        # rebalance, counting the promotions on the way up
+        h = 0
+        while node != VIRTUAL:
+            lh = height[left[node]]
+            rh = height[right[node]]
+            if lh - rh == 2 or rh - lh == 2:
+                top = store.balance(node)
+                if parent[top] == VIRTUAL:
+                    self._root = top
+                break
+            new_height = (lh if lh > rh else rh) + 1
+            if new_height == height[node]:
+                break
+            height[node] = new_height
+            h += 1
+            node = parent[node]
+
+        return ArrayAVLNode(store, x), arcs, h
+
+    def _transplant(self, old, new):
+        parent = self._store.parent[old]
+        if parent == VIRTUAL:
+            self._root = new
+        self._store.replace_child(parent, old, new)
+
+    def _shrink_sizes(self, node):
+        size, parent = self._store.size, self._store.parent
+        while node != VIRTUAL:
+            size[node] -= 1
+            node = parent[node]
+
+    def _predecessor(self, node):
+        left, right, parent = self._store.left, self._store.right, self._store.parent
+        if left[node] != VIRTUAL:
+            return self._store.rightmost(left[node])
+        while parent[node] != VIRTUAL and left[parent[node]] == node:
+            node = parent[node]
+        return parent[node]
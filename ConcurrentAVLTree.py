@@ -0,0 +1,92 @@
+"""
+A thread-safe AVL tree for many readers and a few writers.
+
+The tree is a PersistentAVLTree version (a root) published in one
+attribute. Writers take a lock, build the next version by path copying and
+publish its root with a single assignment. Readers read that attribute once
+and work on the version they got, which no writer ever changes, so reads
+never block and never see a half-rotated subtree.
+"""
+
+import threading
+
+from PersistentAVLTree import PersistentAVLTree
+
+
+class ConcurrentAVLTree(object):
+    """A thread-safe dictionary with lock-free reads and serialized writes."""
+
+    def __init__(self):
+        self._root = None
+        self._write_lock = threading.Lock()
+
+    def search(self, key):
+        """searches for a node in the current version, never blocks
+
+        @type key: int
+        @param key: a key to be searched
+        @rtype: (PersistentAVLNode,int)
+        @returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
+        and e is the number of edges on the path between the starting node and ending node+1.
+        """
+        return PersistentAVLTree(self._root).search(key)
+
+    def snapshot(self):
+        """returns the current version as a PersistentAVLTree, never blocks
+
+        @rtype: PersistentAVLTree
+        """
+        return PersistentAVLTree(self._root)
+
+    def insert(self, key, val):
+        """inserts (key, val), replacing the value if key is present
+
+        @type key: int
+        @param key: key of item that is to be inserted to self
+        @type val: string
+        @param val: the value of the item
+        """
+        with self._write_lock:
+            tree = PersistentAVLTree(self._root)
+            tree.insert(key, val)
+            self._root = tree.root
+
+    def delete(self, key):
+        """deletes the item with the given key, if present
+
+        @type key: int
+        @param key: the key of the item to delete
+        @rtype: bool
+        @returns: True if an item was deleted
+        """
+        with self._write_lock:
+            tree = PersistentAVLTree(self._root)
+            deleted = tree.delete(key)
+            self._root = tree.root
+        return deleted
+
+    def apply(self, update):
+        """runs several writes as one atomic step
+
+        @type update: callable
+        @param update: called with a PersistentAVLTree of the current version; readers see
+        either none or all of its changes
+        """
+        with self._write_lock:
+            tree = PersistentAVLTree(self._root)
+            update(tree)
+            self._root = tree.root
+
+    def avl_to_array(self):
+        """returns the items of the current version sorted by key
+
+        @rtype: list
+        """
+        return self.snapshot().avl_to_array()
+
+    def size(self):
+        """returns the number of items in the current version
+
+        @rtype: int
+        """
+        return self.snapshot().size()
@@ -0,0 +1,255 @@
+"""
+An AVLTree made durable with a write-ahead log and checkpoints.
+
+Every change is appended to a log file as a framed record (length, CRC32,
+body) before it is applied to the in-memory tree. Records are buffered and
+written with one fsync per GROUP_SIZE changes (group commit); sync() forces
+the pending records out. A change is durable once the sync that covers it
+returns. A join is logged as one record holding all of its items, so it is
+replayed completely or not at all.
+
+checkpoint() saves the tree with AVLTree.save and starts a new log, so the
+directory holds checkpoint-<generation>.avl files, each with the state
+before wal-<generation>.log. Recovery loads the newest checkpoint and
+replays the logs from its generation on. The replay collects the changes
+and applies them in bulk with delete_key and insert_many instead of one
+insert per record, and it stops at the first torn or corrupt record.
+"""
+
+import os
+import struct
+import zlib
+
+from AVLTree import AVLTree, _read_snapshot_value, _snapshot_value_record
+
+GROUP_SIZE = 64
+
+RECORD_HEADER = struct.Struct("<II")  # body length and CRC32 of the body
+RECORD_KEY = struct.Struct("<q")
+RECORD_COUNT = struct.Struct("<I")  # the number of items of a JOIN record
+INSERT, DELETE, CLEAR, JOIN = b"I", b"D", b"C", b"J"
+
+
+class DurableAVLTree(object):
+    """An AVLTree whose changes survive a crash.
+
+    @type directory: string
+    @param directory: where the log and checkpoint files live, created if missing
+    @type group_size: int
+    @param group_size: the number of changes written per fsync
+    @type checkpoint_every: int
+    @param checkpoint_every: take a checkpoint after this many changes, None to only
+    checkpoint on request
+    """
+
+    def __init__(self, directory, group_size=GROUP_SIZE, checkpoint_every=None):
+        self.directory = directory
+        self.group_size = group_size
+        self.checkpoint_every = checkpoint_every
+        self._pending = []
+        self._changes_since_checkpoint = 0
+        os.makedirs(directory, exist_ok=True)
+        self.tree, self._generation, log_end = self._recover()
+
+        self._log = open(self._log_path(self._generation), "ab")
+        self._log.truncate(log_end)
+
+    def insert(self, key, val):
+        """inserts (key, val) into the dictionary, see AVLTree.insert"""
+        self._append(INSERT + RECORD_KEY.pack(key) + _snapshot_value_record(val))
+        result = self.tree.insert(key, val)
+        self._maybe_checkpoint()
+        return result
+
+    def finger_insert(self, key, val):
+        """inserts (key, val) into the dictionary, see AVLTree.finger_insert"""
+        self._append(INSERT + RECORD_KEY.pack(key) + _snapshot_value_record(val))
+        result = self.tree.finger_insert(key, val)
+        self._maybe_checkpoint()
+        return result
+
+    def delete(self, node):
+        """deletes node from the dictionary, see AVLTree.delete"""
+        self._append(DELETE + RECORD_KEY.pack(node.key))
+        self.tree.delete(node)
+        self._maybe_checkpoint()
+
+    def delete_key(self, key):
+        """deletes the item with the given key, see AVLTree.delete_key
+
+        @rtype: AVLNode
+        @returns: the deleted node, None if key is not in the dictionary
+        """
+        self._append(DELETE + RECORD_KEY.pack(key))
+        node = self.tree.delete_key(key)
+        self._maybe_checkpoint()
+        return node
+
+    def join(self, tree2, key, val):
+        """joins the dictionary with item and another AVLTree, see AVLTree.join
+
+        The items of tree2 and the separator are logged as one JOIN record.
+        """
+        items = [(node.key, node.value) for node in tree2._in_order_nodes()] + [(key, val)]
+        body = [JOIN, RECORD_COUNT.pack(len(items))]
+        for item_key, item_val in items:
+            body.append(RECORD_KEY.pack(item_key) + _snapshot_value_record(item_val))
+        self._append(b"".join(body), len(items))
+        self.tree.join(tree2, key, val)
+        self._maybe_checkpoint()
+
+    def split(self, node):
+        """splits the dictionary at node, see AVLTree.split
+
+        As with AVLTree.split the dictionary is left empty; the two returned trees are
+        plain AVLTrees and are not logged.
+
+        @rtype: (AVLTree, AVLTree)
+        """
+        self._append(CLEAR)
+        left, right = self.tree.split(node)
+        self._maybe_checkpoint()
+        return left, right
+
+    def sync(self):
+        """writes and fsyncs the pending records"""
+        if not self._pending:
+            return
+        self._log.write(b"".join(self._pending))
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._pending = []
+
+    def checkpoint(self):
+        """saves the tree and starts a new log, then removes the older files"""
+        self.sync()
+        self._log.close()
+        self._generation += 1
+
+        path = self._checkpoint_path(self._generation)
+        self.tree.save(path + ".tmp")
+        with open(path + ".tmp", "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self._log = open(self._log_path(self._generation), "ab")
+        self._sync_directory()
+
+        for name in os.listdir(self.directory):
+            generation = _generation_of(name)
+            if generation is not None and generation < self._generation:
+                os.remove(os.path.join(self.directory, name))
+        self._changes_since_checkpoint = 0
+
+    def close(self):
+        """syncs the pending records and closes the log"""
+        self.sync()
+        self._log.close()
+
+    # ==================== HELPER FUNCTIONS =============================
+
+    def _append(self, body, changes=1):
+        self._pending.append(RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body)
+        if len(self._pending) >= self.group_size:
+            self.sync()
+        self._changes_since_checkpoint += changes
+
+    def _maybe_checkpoint(self):
+        """takes a checkpoint once checkpoint_every changes have been applied since the last one"""
+        if self.checkpoint_every is not None and self._changes_since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def _recover(self):
+        """loads the newest checkpoint and replays the logs after it
+
+        @rtype: (AVLTree, int, int)
+        @returns: the tree, the current generation and the end of the valid records in its log
+        """
+        checkpoints, logs = [], []
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.directory, name))
+            elif name.startswith("checkpoint-"):
+                checkpoints.append(_generation_of(name))
+            elif name.startswith("wal-"):
+                logs.append(_generation_of(name))
+
+        generation = max(checkpoints, default=0)
+        if checkpoints:
+            tree = AVLTree.load(self._checkpoint_path(generation))
+        else:
+            tree = AVLTree()
+
+        inserts, deletes = {}, set()
+        log_end = 0
+        for log_generation in sorted(g for g in logs if g >= generation):
+            generation = log_generation
+            with open(self._log_path(log_generation), "rb") as f:
+                data = f.read()
+            log_end = 0
+            for body, log_end in _records(data):
+                key = RECORD_KEY.unpack_from(body, 1)[0] if body[:1] in (INSERT, DELETE) else None
+                if body[:1] == INSERT:
+                    inserts[key] = _read_snapshot_value(body, 1 + RECORD_KEY.size)[0]
+                elif body[:1] == JOIN:
+                    inserts.update(_join_items(body))
+                elif body[:1] == DELETE:
+                    # a key inserted in this batch was not in the tree before it
+                    if inserts.pop(key, _MISSING) is _MISSING:
+                        deletes.add(key)
+                else:
+                    tree = AVLTree()
+                    inserts, deletes = {}, set()
+
+        for key in deletes:
+            tree.delete_key(key)
+        tree.insert_many(inserts.items())
+        return tree, generation, log_end
+
+    def _sync_directory(self):
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _checkpoint_path(self, generation):
+        return os.path.join(self.directory, f"checkpoint-{generation:08d}.avl")
+
+    def _log_path(self, generation):
+        return os.path.join(self.directory, f"wal-{generation:08d}.log")
+
+
+_MISSING = object()
+
+
+def _generation_of(name):
+    """returns the generation of a checkpoint or log file name, None for other files"""
+    stem, _, extension = name.partition(".")
+    prefix, _, generation = stem.partition("-")
+    if prefix in ("checkpoint", "wal") and extension in ("avl", "log") and generation.isdigit():
+        return int(generation)
+    return None
+
+
+def _join_items(body):
+    """yields the (key, value) items of a JOIN record"""
+    (count,) = RECORD_COUNT.unpack_from(body, 1)
+    offset = 1 + RECORD_COUNT.size
+    for _ in range(count):
+        (key,) = RECORD_KEY.unpack_from(body, offset)
+        val, offset = _read_snapshot_value(body, offset + RECORD_KEY.size)
+        yield key, val
+
+
+def _records(data):
+    """yields (body, end offset) of every complete and intact record in a log"""
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        length, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        body = data[start:start + length]
+        if len(body) < length or zlib.crc32(body) != crc:
+            return
+        offset = start + length
+        yield body, offset
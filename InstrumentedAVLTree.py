@@ -0,0 +1,265 @@
+"""
+An AVLTree that records per-operation latency histograms.
+
+InstrumentedAVLTree times insert, finger_insert, delete, search,
+finger_search, split and join (every call, or one in every sample_every
+calls), and records the latencies in a LatencyHistogram: log-bucketed in the style of HDR histograms, with
+2**SUB_BUCKET_BITS buckets per power of two, so a percentile is accurate to
+within 1 / 2**SUB_BUCKET_BITS of its value.
+Operations built from these (delete_key, pop, concat, ...) are recorded as
+the operations they call. Trees split off an InstrumentedAVLTree (split,
+split_at_key, extract_range, ...) are InstrumentedAVLTrees that record into
+the same histograms.
+
+metrics() returns a snapshot of the counts, percentiles, height, size and
+rotation totals, and export_prometheus(path) writes it in the Prometheus
+text format, with the same PROMETHEUS_BUCKETS on every export. The tree
+observer stays free for other uses.
+"""
+
+import bisect
+import functools
+import os
+from array import array
+from time import perf_counter_ns
+
+from AVLTree import AVLTree
+
+SUB_BUCKET_BITS = 3
+# enough buckets for latencies up to 2**60 ns
+BUCKET_COUNT = (60 << SUB_BUCKET_BITS) + (2 << SUB_BUCKET_BITS)
+# latencies are buffered and folded into the buckets in batches of this size
+FOLD_SIZE = 4096
+OPERATIONS = ("insert", "finger_insert", "delete", "search", "finger_search", "split", "join")
+PERCENTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99, "p999": 0.999}
+# the exported histogram buckets, every power of two from 256 ns to about 69 s,
+# in nanoseconds; powers of two are bucket bounds, so the exported counts are exact
+PROMETHEUS_BUCKETS = tuple(1 << power for power in range(8, 37))
+
+
+def bucket_of(nanoseconds):
+    """returns the index of the bucket holding a latency; buckets include their upper
+    bound, like Prometheus le buckets"""
+    below = max(nanoseconds - 1, 0)
+    shift = below.bit_length() - SUB_BUCKET_BITS - 1
+    if shift < 0:
+        return below
+    return (shift << SUB_BUCKET_BITS) + (below >> shift)
+
+
+def bucket_upper_bound(index):
+    """returns the inclusive upper bound in nanoseconds of a bucket"""
+    shift = max((index >> SUB_BUCKET_BITS) - 1, 0)
+    top = index - (shift << SUB_BUCKET_BITS)
+    return (top + 1) << shift
+
+
+class LatencyHistogram(object):
+    """A histogram of latencies in nanoseconds with logarithmic buckets.
+
+    record only appends to a buffer; full buffers are sorted and folded into the
+    buckets with one bisect per bucket, which keeps the cost per latency low.
+    """
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.pending = array("q")
+
+    def record(self, nanoseconds):
+        """adds one latency"""
+        self.pending.append(nanoseconds)
+        if len(self.pending) >= FOLD_SIZE:
+            self.fold()
+
+    def fold(self):
+        """moves the buffered latencies into the buckets"""
+        if not self.pending:
+            return
+        latencies = sorted(self.pending)
+        del self.pending[:]
+        self.count += len(latencies)
+        self.total += sum(latencies)
+        self.max = max(self.max, latencies[-1])
+
+        start = 0
+        while start < len(latencies):
+            index = bucket_of(latencies[start])
+            end = bisect.bisect_right(latencies, bucket_upper_bound(index), start)
+            self.counts[index] += end - start
+            start = end
+
+    def percentile(self, fraction):
+        """returns the upper bound in nanoseconds of the bucket holding the given fraction of
+        the latencies, 0 if the histogram is empty"""
+        self.fold()
+        target = fraction * self.count
+        seen = 0
+        for index, upper in self.buckets():
+            seen += self.counts[index]
+            if seen >= target:
+                return min(upper, self.max)
+        return 0
+
+    def counts_at_most(self, bounds):
+        """returns the number of latencies at most each of the increasing bounds, every
+        bound must be the upper bound of a bucket"""
+        self.fold()
+        counts = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            while index < BUCKET_COUNT and bucket_upper_bound(index) <= bound:
+                seen += self.counts[index]
+                index += 1
+            counts.append(seen)
+        return counts
+
+    def buckets(self):
+        """yields (bucket index, inclusive upper bound in nanoseconds) of the non-empty buckets in order"""
+        self.fold()
+        for index, count in enumerate(self.counts):
+            if count:
+                yield index, bucket_upper_bound(index)
+
+
+def _timed(name):
+    """an AVLTree method that times one in every sample_every calls into latency[name]"""
+    method = getattr(AVLTree, name)
+
+    @functools.wraps(method)
+    def timed(self, *args, **kwargs):
+        countdown = self._countdowns[name] - 1
+        if countdown:
+            self._countdowns[name] = countdown
+            return method(self, *args, **kwargs)
+        self._countdowns[name] = self.sample_every
+        start = perf_counter_ns()
+        result = method(self, *args, **kwargs)
+        self.latency[name].record(perf_counter_ns() - start)
+        return result
+
+    return timed
+
+
+class InstrumentedAVLTree(AVLTree):
+    """An AVLTree that records the latency of its operations.
+
+    The overhead misses the 5% budget: on metrics_benchmark.py's random inserts,
+    searches and deletes it is about +30% with the default sample_every=1, and
+    about +15% with any sample_every from 8 up, since every call still goes
+    through the timing wrapper and every rotation through its counting override.
+    The default keeps exact counts; pass a larger sample_every to halve the cost.
+
+    @type sample_every: int
+    @param sample_every: time one in every sample_every calls of each operation; the
+    other calls only pay for a countdown. Counts are scaled back up by sample_every.
+    """
+
+    def __init__(self, sample_every=1):
+        super().__init__()
+        self.sample_every = sample_every
+        self.latency = {operation: LatencyHistogram() for operation in OPERATIONS}
+        self.rotations = {"left": 0, "right": 0, "right_left": 0, "left_right": 0}
+        self._countdowns = dict.fromkeys(OPERATIONS, sample_every)
+
+    insert = _timed("insert")
+    finger_insert = _timed("finger_insert")
+    delete = _timed("delete")
+    search = _timed("search")
+    finger_search = _timed("finger_search")
+    split = _timed("split")
+    join = _timed("join")
+
+    def _new_tree(self):
+        """trees split off self are instrumented too and record into the same histograms
+        and rotation counts"""
+        tree = InstrumentedAVLTree(self.sample_every)
+        tree._observer = self._observer
+        tree.latency = self.latency
+        tree.rotations = self.rotations
+        return tree
+
+    def left_rotation(self, criminal_node, child_node):
+        self.rotations["left"] += 1
+        super().left_rotation(criminal_node, child_node)
+
+    def right_rotation(self, criminal_node, child_node):
+        self.rotations["right"] += 1
+        super().right_rotation(criminal_node, child_node)
+
+    def right_then_left_rotation(self, criminal_node, child_node, grandchild_node):
+        self.rotations["right_left"] += 1
+        super().right_then_left_rotation(criminal_node, child_node, grandchild_node)
+
+    def left_then_right_rotation(self, criminal_node, child_node, grandchild_node):
+        self.rotations["left_right"] += 1
+        super().left_then_right_rotation(criminal_node, child_node, grandchild_node)
+
+    def metrics(self):
+        """returns a snapshot of the recorded metrics
+
+        @rtype: dict
+        @returns: {"operations": {operation: {"count", "sum_seconds", "max_seconds",
+        "p50", "p90", "p99", "p999"}}, "height", "size", "rotations": {kind: count}},
+        with the percentiles in seconds; with sampling, count and sum_seconds are estimates
+        """
+        operations = {}
+        for operation, histogram in self.latency.items():
+            histogram.fold()
+            summary = {
+                "count": histogram.count * self.sample_every,
+                "sum_seconds": histogram.total * self.sample_every / 1e9,
+                "max_seconds": histogram.max / 1e9,
+            }
+            for name, fraction in PERCENTILES.items():
+                summary[name] = histogram.percentile(fraction) / 1e9
+            operations[operation] = summary
+
+        return {
+            "operations": operations,
+            "height": self.root.height if self.root is not None else -1,
+            "size": self.size(),
+            "rotations": dict(self.rotations),
+        }
+
+    def export_prometheus(self, path):
+        """writes the metrics to path in the Prometheus text format
+
+        The file is replaced atomically, so it can be read by the node exporter's
+        textfile collector at any time.
+
+        @type path: string
+        @param path: the file to write
+        """
+        lines = [
+            "# HELP avltree_operation_latency_seconds Latency of AVLTree operations.",
+            "# TYPE avltree_operation_latency_seconds histogram",
+        ]
+        # like metrics(), sampled counts are scaled up by sample_every
+        scale = self.sample_every
+        for operation, histogram in self.latency.items():
+            for upper, count in zip(PROMETHEUS_BUCKETS, histogram.counts_at_most(PROMETHEUS_BUCKETS)):
+                lines.append(f'avltree_operation_latency_seconds_bucket{{operation="{operation}",le="{upper / 1e9:.9g}"}} {count * scale}')
+            lines.append(f'avltree_operation_latency_seconds_bucket{{operation="{operation}",le="+Inf"}} {histogram.count * scale}')
+            lines.append(f'avltree_operation_latency_seconds_sum{{operation="{operation}"}} {histogram.total * scale / 1e9:.9g}')
+            lines.append(f'avltree_operation_latency_seconds_count{{operation="{operation}"}} {histogram.count * scale}')
+
+        metrics = self.metrics()
+        lines += [
+            "# HELP avltree_height Height of the tree.",
+            "# TYPE avltree_height gauge",
+            f"avltree_height {metrics['height']}",
+            "# HELP avltree_size Number of items in the tree.",
+            "# TYPE avltree_size gauge",
+            f"avltree_size {metrics['size']}",
+            "# HELP avltree_rotations_total Rotations done while rebalancing.",
+            "# TYPE avltree_rotations_total counter",
+        ]
+        lines += [f'avltree_rotations_total{{kind="{kind}"}} {count}' for kind, count in metrics["rotations"].items()]
+
+        with open(path + ".tmp", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
@@ -0,0 +1,137 @@
+"""
+An AVLTree loaded lazily from a memory-mapped snapshot file.
+
+AVLTree.load(path, lazy=True) returns a MappedAVLTree. Until it is first
+used for anything other than search or size, it answers search by binary
+search over the mapped key column, following the same path a tree built by
+from_sorted would take, so the arc counts match. The nodes it returns are
+detached AVLNode objects, cached by position.
+
+Any other use reads the tree fields (root, max, min, size), and the first
+such read builds the tree from the file in linear time, reusing the cached
+nodes so they stay valid, and unmaps the file. Methods that are passed a node
+build the tree before they run, since a detached node has no links to follow.
+"""
+
+import functools
+
+from AVLTree import AVLNode, AVLTree, SNAPSHOT_HEADER, _read_snapshot_value
+
+
+def _materialized(name):
+    """a tree field that builds the tree from the file before it is read"""
+    storage = "_materialized" + name
+
+    def get(self):
+        if self._buffer is not None:
+            self._materialize()
+        return getattr(self, storage)
+
+    def set(self, value):
+        setattr(self, storage, value)
+
+    return property(get, set)
+
+
+def _materializing(name):
+    """a method taking a node that builds the tree from the file before it runs"""
+    method = getattr(AVLTree, name)
+
+    @functools.wraps(method)
+    def run(self, *args):
+        if self._buffer is not None:
+            self._materialize()
+        return method(self, *args)
+
+    return run
+
+
+class MappedAVLTree(AVLTree):
+    """An AVLTree served from a snapshot file until its first mutation.
+
+    @type buffer: mmap.mmap
+    @param buffer: the mapped snapshot file
+    @type count: int
+    @param count: the number of items in the file
+    """
+
+    root = _materialized("_root")
+    _max_node = _materialized("_max_node")
+    _min_node = _materialized("_min_node")
+    _last_node = _materialized("_last_node")
+    _size = _materialized("_size")
+
+    delete = _materializing("delete")
+    split = _materializing("split")
+    finger_search_from = _materializing("finger_search_from")
+    finger_insert_from = _materializing("finger_insert_from")
+    _climb_towards = _materializing("_climb_towards")
+    _successor = _materializing("_successor")
+    _predecessor = _materializing("_predecessor")
+
+    def __init__(self, buffer, count):
+        self._buffer = None
+        super().__init__()
+        keys_start = SNAPSHOT_HEADER.size
+        offsets_start = keys_start + 8 * count
+        self._count = count
+        self._keys = memoryview(buffer)[keys_start:offsets_start].cast("q")
+        self._offsets = memoryview(buffer)[offsets_start:offsets_start + 8 * count].cast("Q")
+        self._nodes = {}
+        self._buffer = buffer
+
+    def search(self, key):
+        """searches for a node in the dictionary corresponding to the key (starting at the root)
+
+        @type key: int
+        @param key: a key to be searched
+        @rtype: (AVLNode,int)
+        @returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
+        and e is the number of edges on the path between the starting node and ending node+1.
+        """
+        if self._buffer is None:
+            return super().search(key)
+
+        start, end = 0, self._count
+        arcs = 0
+        while start < end:
+            arcs += 1
+            mid = (start + end) // 2
+            mid_key = self._keys[mid]
+            if mid_key == key:
+                return self._node_at(mid), arcs
+            if mid_key > key:
+                end = mid
+            else:
+                start = mid + 1
+        return None, arcs
+
+    def size(self):
+        """returns the number of items in dictionary
+
+        @rtype: int
+        @returns: the number of items in dictionary
+        """
+        if self._buffer is None:
+            return super().size()
+        return self._count
+
+    def _node_at(self, index):
+        """returns the cached node of the item at index in the file"""
+        node = self._nodes.get(index)
+        if node is None:
+            val, _ = _read_snapshot_value(self._buffer, self._offsets[index])
+            node = AVLNode(self._keys[index], val)
+            self._nodes[index] = node
+        return node
+
+    def _materialize(self):
+        """builds the tree from the file and unmaps it"""
+        nodes = [self._node_at(index) for index in range(self._count)]
+        buffer = self._buffer
+        self._buffer = None
+        self._keys.release()
+        self._offsets.release()
+        buffer.close()
+        self._nodes = {}
+        self._adopt_sorted_nodes(nodes)
@@ -0,0 +1,284 @@
+"""
+A persistent AVL tree that shares structure between versions.
+
+Nodes have no parent pointers and are never changed after they are built,
+and an empty subtree is None instead of a virtual node. Every mutation
+copies the O(log n) nodes on its path and links the copies to the
+untouched subtrees of the previous version, so a version (a root) stays
+valid for as long as someone references it and is garbage collected after.
+
+PersistentAVLTree is a handle that holds the current root. Its mutating
+methods swap in a new root, and snapshot() returns another handle on the
+current root in O(1). Since nodes are shared between versions, delete
+takes a key instead of a node.
+"""
+
+
+class PersistentAVLNode(object):
+    """An immutable node; height and size are computed from the children.
+
+    @type key: int
+    @param key: key of the node
+    @type value: string
+    @param value: data of the node
+    @type left: PersistentAVLNode
+    @param left: left subtree, None if empty
+    @type right: PersistentAVLNode
+    @param right: right subtree, None if empty
+    """
+
+    __slots__ = ("key", "value", "left", "right", "height", "size")
+
+    def __init__(self, key, value, left=None, right=None):
+        self.key = key
+        self.value = value
+        self.left = left
+        self.right = right
+        self.height = 1 + max(_height(left), _height(right))
+        self.size = 1 + _size(left) + _size(right)
+
+
+class PersistentAVLTree(object):
+    """A persistent AVL tree with O(1) snapshots.
+
+    @type root: PersistentAVLNode
+    @param root: the root of the version to start from, None for an empty tree
+    """
+
+    def __init__(self, root=None):
+        self.root = root
+
+    def search(self, key):
+        """searches for a node in the dictionary corresponding to the key
+
+        @type key: int
+        @param key: a key to be searched
+        @rtype: (PersistentAVLNode,int)
+        @returns: a tuple (x,e) where x is the node corresponding to key (or None if not found),
+        and e is the number of edges on the path between the starting node and ending node+1.
+        """
+        node = self.root
+        arcs = 0
+        while node is not None:
+            arcs += 1
+            if node.key == key:
+                return node, arcs
+            node = node.left if key < node.key else node.right
+        return None, arcs
+
+    def insert(self, key, val):
+        """inserts (key, val) into the dictionary, replacing the value if key is present
+
+        @type key: int
+        @param key: key of item that is to be inserted to self
+        @type val: string
+        @param val: the value of the item
+        """
+        self.root = _insert(self.root, key, val)
+
+    def delete(self, key):
+        """deletes the item with the given key, if present
+
+        @type key: int
+        @param key: the key of the item to delete
+        @rtype: bool
+        @returns: True if an item was deleted
+        """
+        node, _ = self.search(key)
+        if node is None:
+            return False
+        self.root = _delete(self.root, key)
+        return True
+
+    def join(self, tree2, key, val):
+        """joins self with item and another PersistentAVLTree
+
+        tree2 is not changed; the new version of self shares its nodes.
+
+        @type tree2: PersistentAVLTree
+        @param tree2: a dictionary to be joined with self
+        @type key: int
+        @param key: the key separting self and tree2
+        @type val: string
+        @param val: the value corresponding to key
+        @pre: all keys in self are smaller than key and all keys in tree2 are larger than key,
+        or the opposite way
+        """
+        if self.root is not None:
+            self_is_left = self.root.key < key
+        else:
+            self_is_left = tree2.root is None or tree2.root.key > key
+        if self_is_left:
+            self.root = _join(self.root, key, val, tree2.root)
+        else:
+            self.root = _join(tree2.root, key, val, self.root)
+
+    def split(self, key):
+        """splits the dictionary at a given key, self is not changed
+
+        @type key: int
+        @param key: the key to split at, does not have to be in the dictionary
+        @rtype: (PersistentAVLTree, PersistentAVLTree)
+        @returns: a tuple (left, right), where left holds the keys smaller than key and right
+        holds the keys larger than key.
+        """
+        left, _, right = _split(self.root, key)
+        return PersistentAVLTree(left), PersistentAVLTree(right)
+
+    def snapshot(self):
+        """returns a frozen view of the current version in O(1)
+
+        @rtype: PersistentAVLTree
+        """
+        return PersistentAVLTree(self.root)
+
+    def avl_to_array(self):
+        """returns an array representing dictionary
+
+        @rtype: list
+        @returns: a sorted list according to key of touples (key, value) representing the data structure
+        """
+        result = []
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            result.append((node.key, node.value))
+            node = node.right
+        return result
+
+    def max_node(self):
+        """returns the node with the maximal key in the dictionary
+
+        @rtype: PersistentAVLNode
+        @returns: the maximal node, None if the dictionary is empty
+        """
+        node = self.root
+        while node is not None and node.right is not None:
+            node = node.right
+        return node
+
+    def min_node(self):
+        """returns the node with the minimal key in the dictionary
+
+        @rtype: PersistentAVLNode
+        @returns: the minimal node, None if the dictionary is empty
+        """
+        node = self.root
+        while node is not None and node.left is not None:
+            node = node.left
+        return node
+
+    def size(self):
+        """returns the number of items in dictionary
+
+        @rtype: int
+        @returns: the number of items in dictionary
+        """
+        return _size(self.root)
+
+    def get_root(self):
+        """returns the root of the tree representing the dictionary
+
+        @rtype: PersistentAVLNode
+        @returns: the root, None if the dictionary is empty
+        """
+        return self.root
+
+
+# ==================== HELPER FUNCTIONS =============================
+
+
+def _height(node):
+    return -1 if node is None else node.height
+
+
+def _size(node):
+    return 0 if node is None else node.size
+
+
+def _balanced(key, value, left, right):
+    """builds a node over left and right, rotating once or twice if they differ in height by 2"""
+    left_height = _height(left)
+    right_height = _height(right)
+
+    if left_height > right_height + 1:
+        if _height(left.left) >= _height(left.right):  # right rotation
+            return PersistentAVLNode(left.key, left.value, left.left, PersistentAVLNode(key, value, left.right, right))
+        grandchild = left.right  # left then right rotation
+        return PersistentAVLNode(
+            grandchild.key,
+            grandchild.value,
+            PersistentAVLNode(left.key, left.value, left.left, grandchild.left),
+            PersistentAVLNode(key, value, grandchild.right, right),
+        )
+
+    if right_height > left_height + 1:
+        if _height(right.right) >= _height(right.left):  # left rotation
+            return PersistentAVLNode(right.key, right.value, PersistentAVLNode(key, value, left, right.left), right.right)
+        grandchild = right.left  # right then left rotation
+        return PersistentAVLNode(
+            grandchild.key,
+            grandchild.value,
+            PersistentAVLNode(key, value, left, grandchild.left),
+            PersistentAVLNode(right.key, right.value, grandchild.right, right.right),
+        )
+
+    return PersistentAVLNode(key, value, left, right)
+
+
+def _insert(node, key, value):
+    if node is None:
+        return PersistentAVLNode(key, value)
+    if key == node.key:
+        return PersistentAVLNode(key, value, node.left, node.right)
+    if key < node.key:
+        return _balanced(node.key, node.value, _insert(node.left, key, value), node.right)
+    return _balanced(node.key, node.value, node.left, _insert(node.right, key, value))
+
+
+def _pop_min(node):
+    """returns (the subtree without its minimum, the minimal node)"""
+    if node.left is None:
+        return node.right, node
+    left, min_node = _pop_min(node.left)
+    return _balanced(node.key, node.value, left, node.right), min_node
+
+
+def _delete(node, key):
+    """returns the subtree without key, key must be in it"""
+    if key < node.key:
+        return _balanced(node.key, node.value, _delete(node.left, key), node.right)
+    if key > node.key:
+        return _balanced(node.key, node.value, node.left, _delete(node.right, key))
+    if node.left is None:
+        return node.right
+    if node.right is None:
+        return node.left
+    right, successor = _pop_min(node.right)
+    return _balanced(successor.key, successor.value, node.left, right)
+
+
+def _join(left, key, value, right):
+    """joins two subtrees with (key, value) between them, walking down the taller one"""
+    if _height(left) > _height(right) + 1:
+        return _balanced(left.key, left.value, left.left, _join(left.right, key, value, right))
+    if _height(right) > _height(left) + 1:
+        return _balanced(right.key, right.value, _join(left, key, value, right.left), right.right)
+    return PersistentAVLNode(key, value, left, right)
+
+
+def _split(node, key):
+    """returns (left, found, right): the subtrees with smaller and larger keys and the node of key"""
+    if node is None:
+        return None, None, None
+    if key == node.key:
+        return node.left, node, node.right
+    if key < node.key:
+        left, found, right = _split(node.left, key)
+        return left, found, _join(right, node.key, node.value, node.right)
+    left, found, right = _split(node.right, key)
+    return _join(node.left, node.key, node.value, left), found, right
@@ -0,0 +1,226 @@
+"""
+Throughput benchmark suite for AVLTree with stored baselines.
+
+Every operation (search, finger_search, insert, finger_insert, delete,
+join, split, avl_to_array) is timed on the research_tester input orders
+(TestType) at sizes N * 2**i. Each call is timed on its own, and the suite
+reports ops/sec, p50 and p99 latency, and the peak traced memory of a
+separate run under tracemalloc. After a warmup run, every operation is timed
+at least REPEATS times and for at least MIN_SECONDS with the garbage collector
+disabled, and the fastest run is reported. Every run is paired with a timing
+of a fixed reference loop that does not use AVLTree, and the speed relative
+to it is stored too, so a machine that runs slower for a while (frequency
+scaling, noisy neighbours) does not show up as a regression.
+
+Results can be saved as a JSON baseline with --save. With --baseline, a run
+is compared against it and the script exits with status 1 if any operation
+is slower relative to the reference loop than the baseline by more than
+--threshold. Operations that look slower are measured again up to
+CONFIRM_ROUNDS times, keeping their best result, so only a slowdown that
+persists fails the run.
+
+Run: python3 benchmark_suite.py [--sizes 1 3 5] [--repeats 5] [--save FILE] [--baseline FILE] [--threshold 0.2]
+"""
+
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from tabulate import tabulate
+
+from AVLTree import AVLTree
+from research_tester import N, TestType, generate_array
+
+OPERATIONS = ["search", "finger_search", "insert", "finger_insert", "delete", "join", "split", "avl_to_array"]
+SIZES = [1, 3, 5]
+SPLIT_ROUNDS = 200
+ARRAY_ROUNDS = 20
+SEED = 0
+REPEATS = 5
+MIN_SECONDS = 0.5
+CONFIRM_ROUNDS = 2
+REFERENCE_LOOPS = 20_000
+# the default allowed slowdown, about the largest run-to-run change of a single benchmark
+THRESHOLD = 0.20
+
+
+def run_operation(operation, keys):
+    """runs one operation on the given keys, returns the latency of every call in nanoseconds"""
+    clock = time.perf_counter_ns
+    latencies = []
+
+    if operation in ("insert", "finger_insert"):
+        tree = AVLTree()
+        insert = getattr(tree, operation)
+        for key in keys:
+            start = clock()
+            insert(key, None)
+            latencies.append(clock() - start)
+        return latencies
+
+    tree = AVLTree.from_unsorted((key, None) for key in keys)
+    if operation in ("search", "finger_search"):
+        search = getattr(tree, operation)
+        for key in keys:
+            start = clock()
+            search(key)
+            latencies.append(clock() - start)
+
+    elif operation == "delete":
+        for key in keys:
+            node, _ = tree.search(key)
+            start = clock()
+            tree.delete(node)
+            latencies.append(clock() - start)
+
+    elif operation in ("split", "join"):
+        rng = random.Random(SEED)
+        for _ in range(SPLIT_ROUNDS):
+            key = rng.choice(keys)
+            node, _ = tree.search(key)
+            start = clock()
+            left, right = tree.split(node)
+            split_time = clock() - start
+            start = clock()
+            left.join(right, key, None)
+            join_time = clock() - start
+            latencies.append(split_time if operation == "split" else join_time)
+            tree = left
+
+    elif operation == "avl_to_array":
+        for _ in range(ARRAY_ROUNDS):
+            start = clock()
+            tree.avl_to_array()
+            latencies.append(clock() - start)
+
+    return latencies
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[int(fraction * (len(sorted_values) - 1))]
+
+
+def reference_seconds():
+    """returns the time of a fixed pure-Python loop, the yardstick for the machine's current speed"""
+    start = time.perf_counter()
+    total = 0
+    for i in range(REFERENCE_LOOPS):
+        total += i * i
+    return time.perf_counter() - start
+
+
+def timed_runs(operation, keys, repeats):
+    """runs an operation after a warmup run at least repeats times and for at least
+    MIN_SECONDS, with the garbage collector disabled while timing
+
+    @returns: (latencies of the fastest run, median time of the reference loop, timed
+    before every run)
+    """
+    run_operation(operation, keys)
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        runs = []
+        deadline = time.perf_counter() + MIN_SECONDS
+        while len(runs) < repeats or time.perf_counter() < deadline:
+            reference = reference_seconds()
+            runs.append((run_operation(operation, keys), reference))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    references = sorted(reference for _, reference in runs)
+    return min((latencies for latencies, _ in runs), key=sum), references[len(references) // 2]
+
+
+def measure(operation, keys, repeats=REPEATS):
+    """returns the ops/sec, the ops per reference loop time, p50, p99 (microseconds) and
+    peak memory (KiB) of an operation"""
+    latencies, reference = timed_runs(operation, keys, repeats)
+    latencies.sort()
+
+    tracemalloc.start()
+    run_operation(operation, keys)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "ops_per_sec": len(latencies) / (sum(latencies) / 1e9),
+        "ops_per_reference": len(latencies) * reference / (sum(latencies) / 1e9),
+        "p50_us": percentile(latencies, 0.50) / 1e3,
+        "p99_us": percentile(latencies, 0.99) / 1e3,
+        "peak_kib": peak / 1024,
+    }
+
+
+def run_suite(sizes, operations, repeats=REPEATS, only=None):
+    """returns the results keyed by "operation/test type/n", only for the names in only if given"""
+    results = {}
+    for test_type in TestType.to_list():
+        for i in sizes:
+            random.seed(SEED)
+            keys = list(generate_array(i, test_type))
+            for operation in operations:
+                name = f"{operation}/{test_type}/{N * 2**i}"
+                if only is None or name in only:
+                    results[name] = measure(operation, keys, repeats)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """prints the change against the baseline and returns the keys that regressed"""
+    rows = []
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        change = result["ops_per_reference"] / baseline[name]["ops_per_reference"] - 1
+        regressed = change < -threshold
+        if regressed:
+            regressions.append(name)
+        rows.append([name, baseline[name]["ops_per_sec"], result["ops_per_sec"], f"{change:+.1%}", "REGRESSION" if regressed else ""])
+    print("\n" + tabulate(rows, headers=["benchmark", "baseline ops/sec", "ops/sec", "relative change", ""], floatfmt=",.0f"))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="values of i, the size is N * 2**i")
+    parser.add_argument("--operations", nargs="+", default=OPERATIONS, choices=OPERATIONS)
+    parser.add_argument("--save", metavar="FILE", help="write the results as a JSON baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="compare against a JSON baseline")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="timed runs per operation, the fastest is kept")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed slowdown relative to the reference loop (0.20 = 20%%)")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.sizes, args.operations, args.repeats)
+    rows = [[name, r["ops_per_sec"], r["p50_us"], r["p99_us"], r["peak_kib"]] for name, r in results.items()]
+    print(tabulate(rows, headers=["benchmark", "ops/sec", "p50 (us)", "p99 (us)", "peak (KiB)"], floatfmt=",.1f"))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for _ in range(CONFIRM_ROUNDS):
+            if not regressions:
+                break
+            print(f"\nmeasuring {len(regressions)} slower benchmark(s) again")
+            for name, result in run_suite(args.sizes, args.operations, args.repeats, set(regressions)).items():
+                if result["ops_per_reference"] > results[name]["ops_per_reference"]:
+                    results[name] = result
+            regressions = compare({name: results[name] for name in regressions}, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
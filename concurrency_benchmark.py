@@ -0,0 +1,73 @@
+"""
+Throughput benchmark for ConcurrentAVLTree.
+
+For every mix of reader and writer threads, readers search random keys and
+writers insert and delete random keys for a fixed time on a tree that
+starts with n keys. The script reports reads/sec and writes/sec. With the
+GIL the totals show how much the writers' lock and path copying cost the
+readers, not multi-core scaling.
+
+Run: python3 concurrency_benchmark.py [seconds]
+"""
+
+import random
+import sys
+import threading
+import time
+
+from ConcurrentAVLTree import ConcurrentAVLTree
+
+N = 100_000
+SECONDS = 1.0
+THREAD_MIXES = [(1, 0), (4, 0), (0, 1), (1, 1), (4, 1), (8, 1), (4, 2), (8, 4)]
+
+
+def run_mix(tree, readers, writers, seconds):
+    """returns (reads/sec, writes/sec) of the given thread mix"""
+    stop = threading.Event()
+    counts = [0] * (readers + writers)
+
+    def read(slot):
+        rng = random.Random(slot)
+        done = 0
+        while not stop.is_set():
+            tree.search(rng.randrange(2 * N))
+            done += 1
+        counts[slot] = done
+
+    def write(slot):
+        rng = random.Random(slot)
+        done = 0
+        while not stop.is_set():
+            key = rng.randrange(2 * N)
+            if done % 2 == 0:
+                tree.insert(key, None)
+            else:
+                tree.delete(key)
+            done += 1
+        counts[slot] = done
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=write, args=(readers + i,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return sum(counts[:readers]) / seconds, sum(counts[readers:]) / seconds
+
+
+def main(seconds):
+    tree = ConcurrentAVLTree()
+    tree.apply(lambda version: [version.insert(key, None) for key in range(0, 2 * N, 2)])
+
+    print(f"{'readers':>8} {'writers':>8} {'reads/sec':>12} {'writes/sec':>12}")
+    for readers, writers in THREAD_MIXES:
+        reads, writes = run_mix(tree, readers, writers, seconds)
+        print(f"{readers:>8} {writers:>8} {reads:>12,.0f} {writes:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else SECONDS)
@@ -0,0 +1,138 @@
+"""
+Parallel, cached runner for the research_tester experiments.
+
+Every (test type, i, repeat) cell of the part_1 / part_2 / part_3 grid is a
+task. A task seeds the random module from its parameters, generates its
+array once, inserts it with finger_insert while a CountingObserver adds up
+both h (part 1) and e (part 3), and counts the inversions of the same
+array (part 2).
+Tasks run in a process pool, and each finished task is cached on disk
+under a key made of its parameters and a hash of the code it depends on,
+so a re-run only computes the cells that are missing or whose code
+changed.
+
+Run: python3 experiment_runner.py [--max-i 10] [--workers 4] [--no-cache]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from tabulate import tabulate
+
+from AVLTree import AVLTree, CountingObserver
+from research_tester import I, N, REPEAT_COUNT, TestType, count_inversions, generate_array
+
+CACHE_DIR = ".experiment_cache"
+CODE_FILES = ["AVLTree.py", "research_tester.py", "experiment_runner.py"]
+PARTS = [("Part 1: promotions (h)", "h"), ("Part 2: inversions", "inversions"), ("Part 3: arcs (e)", "e")]
+
+
+def code_hash():
+    """returns a hash of the source files the results depend on"""
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in CODE_FILES:
+        with open(os.path.join(directory, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def task_seed(test_type, i, repeat):
+    """returns a seed that depends only on the task parameters"""
+    return int.from_bytes(hashlib.sha256(f"{test_type}/{i}/{repeat}".encode()).digest()[:8], "little")
+
+
+def run_task(task):
+    """runs one grid cell and returns its h, e and inversion totals"""
+    test_type, i, repeat = task
+    random.seed(task_seed(test_type, i, repeat))
+    arr = list(generate_array(i, test_type))
+
+    tree = AVLTree()
+    observer = CountingObserver()
+    tree.set_observer(observer)
+    for num in arr:
+        tree.finger_insert(num, str(num))
+    return {"h": observer.promotions, "e": observer.insert_arcs, "inversions": count_inversions(arr)}
+
+
+def grid(max_i):
+    """returns every (test type, i, repeat) task of the experiments"""
+    tasks = []
+    for test_type in TestType.to_list():
+        repeat = REPEAT_COUNT if TestType.is_random_test(test_type) else 1
+        for i in range(1, max_i + 1):
+            tasks.extend((test_type, i, r) for r in range(repeat))
+    return tasks
+
+
+def cache_path(cache_dir, task, code):
+    key = hashlib.sha256(json.dumps([list(task), code]).encode()).hexdigest()
+    return os.path.join(cache_dir, f"{key}.json")
+
+
+def run_grid(max_i, workers=None, cache_dir=CACHE_DIR):
+    """returns {task: result} for the whole grid, computing only the uncached tasks
+
+    @param cache_dir: directory of the result cache, None to compute everything
+    """
+    tasks = grid(max_i)
+    results = {}
+    missing = []
+    code = code_hash()
+    for task in tasks:
+        path = cache_dir and cache_path(cache_dir, task, code)
+        if path and os.path.exists(path):
+            with open(path) as f:
+                results[task] = json.load(f)
+        else:
+            missing.append(task)
+
+    print(f"{len(tasks) - len(missing)} of {len(tasks)} tasks cached, running {len(missing)}")
+    if missing:
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # the largest tasks first, so the pool does not wait on one at the end
+            missing.sort(key=lambda task: -task[1])
+            for task, result in zip(missing, pool.map(run_task, missing)):
+                results[task] = result
+                if cache_dir:
+                    with open(cache_path(cache_dir, task, code), "w") as f:
+                        json.dump(result, f)
+    return results
+
+
+def print_tables(results, max_i):
+    test_types = TestType.to_list()[::-1]  # Reverse
+    headers = ["i", "n"] + test_types
+    for title, field in PARTS:
+        table_data = []
+        for i in range(1, max_i + 1):
+            row = [i, N * 2**i]
+            for test_type in test_types:
+                values = [result[field] for (t, task_i, _), result in results.items() if t == test_type and task_i == i]
+                row.append(sum(values) // len(values))
+            table_data.append(row)
+        print(f"\n========= {title} =========")
+        print(tabulate(table_data, headers=headers, tablefmt="grid"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="runs the research_tester experiments in parallel")
+    parser.add_argument("--max-i", type=int, default=I, help="largest i, the size is N * 2**i")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: CPUs)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true", help="compute every task and do not store results")
+    args = parser.parse_args(argv)
+
+    results = run_grid(args.max_i, args.workers, None if args.no_cache else args.cache_dir)
+    print_tables(results, args.max_i)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,22 @@ Tests all required functionality from the project specification
 """
 
 import unittest
+import importlib.util
 import random
-from AVLTree import AVLTree, AVLNode
+import os
+import tempfile
+import threading
+from AVLTree import AVLTree, AVLNode, AVLTreeObserver, CountingObserver, create_tree
+from ArrayAVLTree import ArrayAVLTree
+from PersistentAVLTree import PersistentAVLTree
+from ConcurrentAVLTree import ConcurrentAVLTree
+from MappedAVLTree import MappedAVLTree
+from DurableAVLTree import DurableAVLTree
+from InstrumentedAVLTree import InstrumentedAVLTree, LatencyHistogram, PROMETHEUS_BUCKETS, bucket_of, bucket_upper_bound
+
+# research_tester needs tabulate, and count_inversions_numpy needs numpy
+HAS_TABULATE = importlib.util.find_spec("tabulate") is not None
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
 
 GRADE = 0
 MAX_GRADE = 100
@@ -972,6 +986,1087 @@ class AVLTreeTester(unittest.TestCase):
 
         self.assertTrue(self.verify_avl_properties(self.tree))
 
+    def test_node_has_no_instance_dict(self):
+        """Test that nodes are slotted and still expose their attributes"""
+        x, _, _ = self.tree.insert(10, "10")
+
+        self.assertFalse(hasattr(x, "__dict__"))
+        self.assertEqual((x.key, x.value, x.height), (10, "10", 0))
+        self.assertIsNone(x.parent)
+        self.assertFalse(x.left.is_real_node())
+
+    def test_from_sorted(self):
+        """Test bulk construction from sorted items"""
+        for n in [0, 1, 2, 3, 10, 100, 1000]:
+            tree = AVLTree.from_sorted((k, str(k)) for k in range(n))
+
+            self.assertEqual(tree.size(), n)
+            self.assertEqual(tree.avl_to_array(), [(k, str(k)) for k in range(n)])
+            self.assertTrue(self.verify_avl_properties(tree))
+            if n:
+                self.assertEqual(tree.max_node().key, n - 1)
+                self.assertTrue(self._verify_parent_pointers(tree.get_root()))
+            else:
+                self.assertIsNone(tree.get_root())
+                self.assertIsNone(tree.max_node())
+
+        tree = AVLTree.from_sorted((k, str(k)) for k in range(100))
+        tree.insert(1000, "1000")
+        tree.delete(tree.search(50)[0])
+        self.assertTrue(self.verify_avl_properties(tree))
+        self.assertEqual(tree.size(), 100)
+
+    def test_from_unsorted(self):
+        """Test bulk construction from unsorted items"""
+        keys = list(range(500))
+        random.shuffle(keys)
+        tree = AVLTree.from_unsorted((k, str(k)) for k in keys)
+
+        self.assertEqual([k for k, _ in tree.avl_to_array()], list(range(500)))
+        self.assertTrue(self.verify_avl_properties(tree))
+        self.assertEqual(tree.max_node().key, 499)
+
+    def test_insert_many_small_batch(self):
+        """Test merging a small batch into a large tree keeps existing nodes"""
+        for k in range(0, 400, 2):
+            self.tree.insert(k, str(k))
+        handles = {k: self.tree.search(k)[0] for k in range(0, 400, 2)}
+
+        batch = [(k, str(k)) for k in [401, 1, 37, 199, 3, -5]]
+        self.tree.insert_many(batch)
+
+        self.assertEqual(self.tree.size(), 206)
+        self.assertEqual(self.tree.max_node().key, 401)
+        self.assertTrue(self.verify_avl_properties(self.tree))
+        self.assertTrue(self._verify_parent_pointers(self.tree.get_root()))
+        self.assertEqual([k for k, _ in self.tree.avl_to_array()], sorted(list(range(0, 400, 2)) + [-5, 1, 3, 37, 199, 401]))
+        for k, node in handles.items():
+            self.assertIs(self.tree.search(k)[0], node)
+
+    def test_insert_many_medium_batch(self):
+        """Test merging a batch that is split across many subtrees"""
+        keys = random.sample(range(10000), 2000)
+        for k in keys[:1500]:
+            self.tree.insert(k, str(k))
+        self.tree.insert_many((k, str(k)) for k in keys[1500:])
+
+        self.assertEqual(self.tree.avl_to_array(), [(k, str(k)) for k in sorted(keys)])
+        self.assertEqual(self.tree.size(), 2000)
+        self.assertEqual(self.tree.max_node().key, max(keys))
+        self.assertEqual(self.tree.min_node().key, min(keys))
+        self.assertTrue(self.verify_avl_properties(self.tree))
+        self.assertTrue(self._verify_parent_pointers(self.tree.get_root()))
+        for i, k in enumerate(sorted(keys)):
+            self.assertEqual(self.tree.rank(k), i + 1)
+
+    def test_insert_many_large_batch(self):
+        """Test merging batches that trigger a rebuild, including into an empty tree"""
+        keys = list(range(300))
+        random.shuffle(keys)
+        self.tree.insert_many((k, str(k)) for k in keys[:100])
+        self.tree.insert_many((k, str(k)) for k in keys[100:])
+        self.tree.insert_many([])
+
+        self.assertEqual(self.tree.avl_to_array(), [(k, str(k)) for k in range(300)])
+        self.assertEqual(self.tree.size(), 300)
+        self.assertEqual(self.tree.max_node().key, 299)
+        self.assertTrue(self.verify_avl_properties(self.tree))
+        self.assertTrue(self._verify_parent_pointers(self.tree.get_root()))
+
+    def test_delete_keeps_balance_with_balanced_child(self):
+        """Test deletes that leave the taller child balanced need a single rotation"""
+        for k in [50, 30, 70, 20, 40, 80, 10, 25, 35, 45]:
+            self.tree.insert(k, str(k))
+
+        self.tree.delete(self.tree.search(80)[0])
+
+        self.assertTrue(self.verify_avl_properties(self.tree))
+        self.assertEqual(self.tree.get_root().key, 30)
+
+        # the mirrored case, a right-heavy node whose right child is balanced
+        mirrored = AVLTree()
+        for k in [50, 30, 70, 60, 80, 20, 55, 65, 75, 85]:
+            mirrored.insert(k, str(k))
+
+        mirrored.delete(mirrored.search(20)[0])
+
+        self.assertTrue(self.verify_avl_properties(mirrored))
+        self.assertEqual(mirrored.get_root().key, 70)
+
+    def test_rank_select_count_range(self):
+        """Test order statistics on a tree built with inserts and deletes"""
+        keys = list(range(0, 200, 2))
+        random.shuffle(keys)
+        for k in keys:
+            self.tree.insert(k, str(k))
+        for k in range(0, 200, 10):
+            self.tree.delete(self.tree.search(k)[0])
+        remaining = [k for k in range(0, 200, 2) if k % 10]
+
+        self.assertTrue(self._verify_subtree_sizes(self.tree.get_root()))
+        for position, k in enumerate(remaining, start=1):
+            self.assertEqual(self.tree.rank(k), position)
+            self.assertEqual(self.tree.select(position).key, k)
+        self.assertEqual(self.tree.rank(-1), 0)
+        self.assertEqual(self.tree.rank(5), 2)
+        self.assertIsNone(self.tree.select(0))
+        self.assertIsNone(self.tree.select(len(remaining) + 1))
+
+        self.assertEqual(self.tree.count_range(0, 199), len(remaining))
+        self.assertEqual(self.tree.count_range(4, 12), 4)
+        self.assertEqual(self.tree.count_range(11, 11), 0)
+        self.assertEqual(self.tree.count_range(12, 4), 0)
+
+    def test_split_sets_size(self):
+        """Test that split and join keep tree sizes and subtree sizes"""
+        keys = list(range(1, 101))
+        random.shuffle(keys)
+        for k in keys:
+            self.tree.insert(k, str(k))
+
+        left, right = self.tree.split(self.tree.search(40)[0])
+        self.assertEqual((left.size(), right.size()), (39, 60))
+        self.assertTrue(self._verify_subtree_sizes(left.get_root()))
+        self.assertTrue(self._verify_subtree_sizes(right.get_root()))
+        self.assertEqual(right.select(1).key, 41)
+
+        left.join(right, 40, "40")
+        self.assertEqual(left.size(), 100)
+        self.assertTrue(self._verify_subtree_sizes(left.get_root()))
+        self.assertEqual(left.rank(40), 40)
+
+    def _verify_subtree_sizes(self, node):
+        """Recursively verify the size field of every node"""
+        if not node or not node.is_real_node():
+            return True
+        if node.size != node.left.size + node.right.size + 1:
+            return False
+        return self._verify_subtree_sizes(node.left) and self._verify_subtree_sizes(node.right)
+
+    def test_iter_range(self):
+        """Test lazy range scans in both directions"""
+        keys = list(range(0, 100, 3))
+        random.shuffle(keys)
+        for k in keys:
+            self.tree.insert(k, str(k))
+
+        self.assertEqual(list(self.tree.iter_range(10, 30)), [(k, str(k)) for k in [12, 15, 18, 21, 24, 27, 30]])
+        self.assertEqual([k for k, _ in self.tree.iter_range(10, 30, reverse=True)], [30, 27, 24, 21, 18, 15, 12])
+        self.assertEqual([k for k, _ in self.tree.iter_range(95)], [96, 99])
+        self.assertEqual([k for k, _ in self.tree.iter_range(hi=4, reverse=True)], [3, 0])
+        self.assertEqual(list(self.tree.iter_range(13, 14)), [])
+        self.assertEqual(list(self.tree.iter_range(30, 10)), [])
+
+        self.assertEqual(list(self.tree), self.tree.avl_to_array())
+        self.assertEqual(list(reversed(self.tree)), self.tree.avl_to_array()[::-1])
+        self.assertEqual(list(AVLTree()), [])
+
+    def test_iter_range_is_lazy(self):
+        """Test that a range scan can stop early on a large tree"""
+        tree = AVLTree.from_sorted((k, str(k)) for k in range(10000))
+        scan = tree.iter_range(5000)
+
+        self.assertEqual([next(scan)[0] for _ in range(3)], [5000, 5001, 5002])
+
+    def test_min_node_maintenance(self):
+        """Test min_node through inserts, deletes, joins and splits"""
+        self.assertIsNone(self.tree.min_node())
+        for k in [10, 4, 22, 8, 30, 1, 15]:
+            self.tree.insert(k, str(k))
+        self.assertEqual(self.tree.min_node().key, 1)
+
+        self.tree.delete(self.tree.min_node())
+        self.assertEqual(self.tree.min_node().key, 4)
+        self.tree.delete(self.tree.min_node())
+        self.assertEqual(self.tree.min_node().key, 8)
+
+        left, right = self.tree.split(self.tree.search(15)[0])
+        self.assertEqual((left.min_node().key, right.min_node().key), (8, 22))
+
+        other = AVLTree()
+        other.insert(2, "2")
+        right.join(other, 5, "5")
+        self.assertEqual(right.min_node().key, 2)
+
+        single = AVLTree()
+        single.insert(7, "7")
+        single.delete(single.min_node())
+        self.assertIsNone(single.min_node())
+
+    def test_finger_search_min(self):
+        """Test finger search starting from the minimum"""
+        for i in range(1, 101):
+            self.tree.insert(i, str(i))
+
+        node, e = self.tree.finger_search_min(1)
+        self.assertEqual((node.key, e), (1, 1))
+
+        node, e1 = self.tree.finger_search_min(5)
+        _, e2 = self.tree.search(5)
+        self.assertEqual(node.key, 5)
+        self.assertLessEqual(e1, e2)
+
+        node, _ = self.tree.finger_search_min(100)
+        self.assertEqual(node.key, 100)
+        self.assertIsNone(self.tree.finger_search_min(0)[0])
+        self.assertIsNone(self.tree.finger_search_min(101)[0])
+
+    def test_finger_insert_min_descending(self):
+        """Test that descending finger inserts from the min stay cheap"""
+        total_e = 0
+        for i in range(100, 0, -1):
+            x, e, h = self.tree.finger_insert_min(i, str(i))
+            self.assertEqual(x.key, i)
+            total_e += e
+
+        self.assertEqual(self.tree.min_node().key, 1)
+        self.assertEqual(self.tree.max_node().key, 100)
+        self.assertTrue(self.verify_avl_properties(self.tree))
+        self.assertLessEqual(total_e, 4 * 100)
+
+        tree = AVLTree()
+        x, e, h = tree.finger_insert_min(5, "5")
+        self.assertEqual((x.key, e, h), (5, 0, 0))
+
+    def test_finger_search_from_node(self):
+        """Test finger search starting from arbitrary nodes"""
+        keys = list(range(0, 200, 2))
+        random.shuffle(keys)
+        for k in keys:
+            self.tree.insert(k, str(k))
+
+        for start in [0, 50, 100, 198]:
+            start_node, _ = self.tree.search(start)
+            for k in range(-1, 201):
+                node, e = self.tree.finger_search_from(start_node, k)
+                if k % 2 == 0 and 0 <= k < 200:
+                    self.assertEqual(node.key, k)
+                else:
+                    self.assertIsNone(node)
+                self.assertGreaterEqual(e, 1)
+
+        node, _ = self.tree.search(100)
+        self.assertEqual(self.tree.finger_search_from(node, 100), (node, 1))
+
+    def test_finger_insert_from_node(self):
+        """Test finger insert starting from arbitrary nodes"""
+        for k in range(0, 100, 2):
+            self.tree.insert(k, str(k))
+
+        start, _ = self.tree.search(40)
+        x, e, h = self.tree.finger_insert_from(start, 41, "41")
+        self.assertEqual(x.key, 41)
+        self.assertLessEqual(e, self.tree.search(41)[1])
+
+        for k in [1, 99, 57, 13]:
+            start, _ = self.tree.search(random.randrange(0, 100, 2))
+            self.tree.finger_insert_from(start, k, str(k))
+
+        self.assertTrue(self.verify_avl_properties(self.tree))
+        self.assertEqual(self.tree.size(), 55)
+        self.assertEqual(self.tree.max_node().key, 99)
+
+    def test_last_accessed_finger(self):
+        """Test that sequential access through the last accessed node is cheap"""
+        self.assertIsNone(self.tree.last_node())
+        self.assertEqual(self.tree.finger_insert_last(1, "1")[0].key, 1)
+        for k in range(2, 1001):
+            x, e, h = self.tree.finger_insert_last(k, str(k))
+            self.assertIs(self.tree.last_node(), x)
+
+        total_e = 0
+        self.tree.search(1)
+        for k in range(1, 1001):
+            node, e = self.tree.finger_search_last(k)
+            self.assertEqual(node.key, k)
+            total_e += e
+        self.assertLess(total_e, 4 * 1000)
+
+        self.tree.delete(self.tree.last_node())
+        self.assertTrue(self.tree.last_node() is None or self.tree.last_node().is_real_node())
+        self.assertIsNone(self.tree.finger_search_last(1000)[0])
+        self.assertTrue(self.verify_avl_properties(self.tree))
+
+    def test_delete_key_and_pop(self):
+        """Test deleting by key without a separate search"""
+        for k in range(1, 21):
+            self.tree.insert(k, str(k))
+
+        node = self.tree.delete_key(7)
+        self.assertEqual(node.key, 7)
+        self.assertIsNone(self.tree.delete_key(7))
+        self.assertEqual(self.tree.pop(8), "8")
+        self.assertEqual(self.tree.pop(8, "missing"), "missing")
+        self.assertIsNone(self.tree.pop(100))
+
+        self.assertEqual(self.tree.size(), 18)
+        self.assertIsNone(self.tree.search(7)[0])
+        self.assertTrue(self.verify_avl_properties(self.tree))
+
+    def test_pop_max_and_pop_min(self):
+        """Test draining a tree from both ends"""
+        keys = list(range(1, 51))
+        random.shuffle(keys)
+        for k in keys:
+            self.tree.insert(k, str(k))
+
+        for expected in range(50, 40, -1):
+            self.assertEqual(self.tree.pop_max(), (expected, str(expected)))
+            self.assertEqual(self.tree.max_node().key, expected - 1)
+        for expected in range(1, 11):
+            self.assertEqual(self.tree.pop_min(), (expected, str(expected)))
+            self.assertEqual(self.tree.min_node().key, expected + 1)
+        self.assertTrue(self.verify_avl_properties(self.tree))
+
+        while self.tree.size() > 0:
+            self.tree.pop_max()
+        self.assertIsNone(self.tree.max_node())
+        self.assertIsNone(self.tree.min_node())
+        self.assertIsNone(self.tree.pop_max())
+        self.assertIsNone(self.tree.pop_min())
+
+    def test_fast_inserts_match_insert(self):
+        """Test that the statistics-free inserts build the same tree as insert"""
+        keys = list(range(300))
+        random.shuffle(keys)
+        for method, fast_method in [("insert", "insert_fast"), ("finger_insert", "finger_insert_fast")]:
+            tree, fast_tree = AVLTree(), AVLTree()
+            for k in keys:
+                getattr(tree, method)(k, str(k))
+                x = getattr(fast_tree, fast_method)(k, str(k))
+                self.assertEqual(x.key, k)
+
+            self.assertTrue(self.verify_avl_properties(fast_tree))
+            self.assertTrue(self._verify_parent_pointers(fast_tree.get_root()))
+            self.assertTrue(self._verify_subtree_sizes(fast_tree.get_root()))
+            self.assertEqual(fast_tree.get_root().key, tree.get_root().key)
+            self.assertEqual(fast_tree.get_root().height, tree.get_root().height)
+            self.assertEqual((fast_tree.min_node().key, fast_tree.max_node().key), (0, 299))
+            self.assertEqual(fast_tree.size(), 300)
+
+    def test_rebalance_stops_early(self):
+        """Test that delete stops updating heights once they no longer change"""
+
+        class CountingTree(AVLTree):
+            refreshes = 0
+
+            def _refresh_node(self, node):
+                CountingTree.refreshes += 1
+                super()._refresh_node(node)
+
+        tree = CountingTree.from_sorted((k, str(k)) for k in range(2**12 - 1))
+        tree.delete_key(0)
+        self.assertEqual(CountingTree.refreshes, 1)
+
+        keys = list(range(2**12 - 1))
+        random.shuffle(keys)
+        for k in keys[:2000]:
+            tree.delete_key(k)
+        self.assertTrue(self.verify_avl_properties(tree))
+        self.assertTrue(self._verify_subtree_sizes(tree.get_root()))
+        self.assertTrue(self._verify_parent_pointers(tree.get_root()))
+        self.assertLess(CountingTree.refreshes, 6 * 2000)
+
+
+    def test_split_join_keep_nodes_and_extremes(self):
+        """Test that split and join reuse the existing nodes and carry max, min and size"""
+        tree = AVLTree.from_sorted((k, str(k)) for k in range(1000))
+        nodes = {node.key: node for node in tree._in_order_nodes()}
+
+        for split_key in [0, 1, 333, 500, 998, 999]:
+            left, right = tree.split(tree.search(split_key)[0])
+            self.assertIsNone(tree.get_root())
+            self.assertEqual(tree.size(), 0)
+
+            for part, keys in [(left, range(split_key)), (right, range(split_key + 1, 1000))]:
+                self.assertTrue(self.verify_avl_properties(part))
+                self.assertTrue(self._verify_parent_pointers(part.get_root()))
+                self.assertTrue(self._verify_subtree_sizes(part.get_root()))
+                self.assertEqual(part.size(), len(keys))
+                self.assertTrue(all(node is nodes[node.key] for node in part._in_order_nodes()))
+                if len(keys) > 0:
+                    self.assertIs(part.min_node(), nodes[keys[0]])
+                    self.assertIs(part.max_node(), nodes[keys[-1]])
+                else:
+                    self.assertIsNone(part.min_node())
+                    self.assertIsNone(part.max_node())
+
+            left.join(right, split_key, str(split_key))
+            tree = left
+            nodes[split_key] = tree.search(split_key)[0]
+            self.assertEqual(tree.size(), 1000)
+            self.assertIs(tree.min_node(), nodes[0])
+            self.assertIs(tree.max_node(), nodes[999])
+            self.assertTrue(self.verify_avl_properties(tree))
+
+    def test_split_at_key(self):
+        """Test split_at_key with present, absent and out of range keys"""
+        for split_key in [-5, 0, 7, 8, 50, 98, 99, 150]:
+            tree = AVLTree.from_sorted((k, str(k)) for k in range(0, 100, 2))
+            left, right = tree.split_at_key(split_key)
+            expected_left = [k for k in range(0, 100, 2) if k < split_key]
+            expected_right = [k for k in range(0, 100, 2) if k >= split_key]
+
+            self.assertEqual([k for k, _ in left.avl_to_array()], expected_left)
+            self.assertEqual([k for k, _ in right.avl_to_array()], expected_right)
+            self.assertEqual(tree.size(), 0)
+            for part, keys in [(left, expected_left), (right, expected_right)]:
+                self.assertTrue(self.verify_avl_properties(part))
+                self.assertTrue(self._verify_parent_pointers(part.get_root()))
+                self.assertTrue(self._verify_subtree_sizes(part.get_root()))
+                self.assertEqual(part.size(), len(keys))
+                if keys:
+                    self.assertEqual((part.min_node().key, part.max_node().key), (keys[0], keys[-1]))
+                else:
+                    self.assertIsNone(part.max_node())
+
+    def test_concat(self):
+        """Test concat of key-disjoint trees in both orders and with empty trees"""
+        for left_keys, right_keys in [(range(50), range(50, 60)), (range(5), range(5, 300)),
+                                      (range(1), range(1, 2)), (range(0), range(10)), (range(10), range(0))]:
+            for self_is_left in [True, False]:
+                left = AVLTree.from_sorted((k, str(k)) for k in left_keys)
+                right = AVLTree.from_sorted((k, str(k)) for k in right_keys)
+                tree, other = (left, right) if self_is_left else (right, left)
+                tree.concat(other)
+
+                expected = list(left_keys) + list(right_keys)
+                self.assertEqual([k for k, _ in tree.avl_to_array()], expected)
+                self.assertEqual(tree.size(), len(expected))
+                self.assertTrue(self.verify_avl_properties(tree))
+                self.assertTrue(self._verify_parent_pointers(tree.get_root()))
+                self.assertTrue(self._verify_subtree_sizes(tree.get_root()))
+                if expected:
+                    self.assertEqual((tree.min_node().key, tree.max_node().key), (expected[0], expected[-1]))
+                    self.assertEqual(tree.search(expected[-1])[0].value, str(expected[-1]))
+
+    def test_set_operations(self):
+        """Test union, intersection and difference against Python sets"""
+        for _ in range(30):
+            keys = set(random.sample(range(500), random.randint(0, 200)))
+            other_keys = set(random.sample(range(500), random.randint(0, 200)))
+            for operation, expected in [("union", keys | other_keys), ("intersection", keys & other_keys),
+                                        ("difference", keys - other_keys)]:
+                tree = AVLTree.from_unsorted((k, "self") for k in keys)
+                other = AVLTree.from_unsorted((k, "other") for k in other_keys)
+                getattr(tree, operation)(other)
+
+                self.assertEqual([k for k, _ in tree.avl_to_array()], sorted(expected))
+                self.assertEqual([k for k, _ in other.avl_to_array()], sorted(other_keys))
+                self.assertTrue(all(val == "self" for k, val in tree.avl_to_array() if k in keys))
+                self.assertEqual(tree.size(), len(expected))
+                self.assertTrue(self.verify_avl_properties(tree))
+                self.assertTrue(self._verify_parent_pointers(tree.get_root()))
+                self.assertTrue(self._verify_subtree_sizes(tree.get_root()))
+                if expected:
+                    self.assertEqual((tree.min_node().key, tree.max_node().key), (min(expected), max(expected)))
+                else:
+                    self.assertIsNone(tree.get_root())
+
+    def test_extract_and_delete_range(self):
+        """Test extract_range and delete_range on inner, outer, partial and empty ranges"""
+        keys = list(range(0, 200, 3))
+        for lo, hi in [(30, 90), (31, 89), (-10, 50), (150, 500), (-1, 1000), (40, 41), (60, 60), (90, 30)]:
+            tree = AVLTree.from_sorted((k, str(k)) for k in keys)
+            removed = tree.extract_range(lo, hi)
+            inside = [k for k in keys if lo <= k <= hi]
+            outside = [k for k in keys if not lo <= k <= hi]
+
+            self.assertEqual(removed.avl_to_array(), [(k, str(k)) for k in inside])
+            self.assertEqual([k for k, _ in tree.avl_to_array()], outside)
+            for part, part_keys in [(tree, outside), (removed, inside)]:
+                self.assertEqual(part.size(), len(part_keys))
+                self.assertTrue(self.verify_avl_properties(part))
+                self.assertTrue(self._verify_parent_pointers(part.get_root()))
+                self.assertTrue(self._verify_subtree_sizes(part.get_root()))
+                if part_keys:
+                    self.assertEqual((part.min_node().key, part.max_node().key), (part_keys[0], part_keys[-1]))
+
+            tree = AVLTree.from_sorted((k, str(k)) for k in keys)
+            self.assertEqual(tree.delete_range(lo, hi), len(inside))
+            self.assertEqual([k for k, _ in tree.avl_to_array()], outside)
+
+    def test_save_and_load(self):
+        """Test that a saved dictionary loads back with the same items and shape"""
+        pairs = [(k, None if k % 5 == 0 else f"value {k} ü") for k in random.sample(range(-10**12, 10**12), 2000)]
+        tree = AVLTree.from_unsorted(pairs)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tree.avl")
+            tree.save(path)
+            loaded = AVLTree.load(path)
+
+            AVLTree().save(os.path.join(directory, "empty.avl"))
+            self.assertIsNone(AVLTree.load(os.path.join(directory, "empty.avl")).get_root())
+
+            with open(os.path.join(directory, "other.bin"), "wb") as f:
+                f.write(b"not a snapshot at all")
+            with self.assertRaises(ValueError):
+                AVLTree.load(os.path.join(directory, "other.bin"))
+
+        self.assertEqual(loaded.avl_to_array(), sorted(pairs))
+        self.assertTrue(self.verify_avl_properties(loaded))
+        self.assertTrue(self._verify_parent_pointers(loaded.get_root()))
+        self.assertTrue(self._verify_subtree_sizes(loaded.get_root()))
+        self.assertEqual(loaded.max_node().key, max(pairs)[0])
+        self.assertEqual(loaded.min_node().key, min(pairs)[0])
+
+        with self.assertRaises(TypeError):
+            AVLTree.from_sorted([(1, 1)]).save(os.devnull)
+
+    def test_lazy_load(self):
+        """Test that a lazily loaded dictionary searches the file and builds the tree on mutation"""
+        tree = AVLTree.from_unsorted((k, str(k)) for k in random.sample(range(10**6), 1000))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tree.avl")
+            tree.save(path)
+            lazy = AVLTree.load(path, lazy=True)
+            eager = AVLTree.load(path)
+
+            self.assertIsInstance(lazy, MappedAVLTree)
+            for k in [pair[0] for pair in tree.avl_to_array()[::50]] + [-1, 10**6]:
+                lazy_node, lazy_arcs = lazy.search(k)
+                eager_node, eager_arcs = eager.search(k)
+                self.assertEqual(lazy_arcs, eager_arcs)
+                self.assertEqual(lazy_node and (lazy_node.key, lazy_node.value), eager_node and (eager_node.key, eager_node.value))
+            self.assertEqual(lazy.size(), 1000)
+
+            key = tree.get_root().key
+            node, _ = lazy.search(key)
+            lazy.delete(node)
+            lazy.insert(-5, "-5")
+
+        self.assertIsNone(lazy.search(key)[0])
+        self.assertEqual(lazy.size(), 1000)
+        self.assertEqual(lazy.min_node().key, -5)
+        self.assertTrue(self.verify_avl_properties(lazy))
+        self.assertTrue(self._verify_parent_pointers(lazy.get_root()))
+
+    def test_lazy_load_node_handles(self):
+        """Test that methods passed a node from a lazy search build the tree first"""
+        tree = AVLTree.from_sorted((k, str(k)) for k in range(0, 200, 2))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tree.avl")
+            tree.save(path)
+            lazy = AVLTree.load(path, lazy=True)
+            left, right = lazy.split(lazy.search(100)[0])
+
+            lazy = AVLTree.load(path, lazy=True)
+            self.assertEqual(lazy.finger_search_from(lazy.search(50)[0], 52)[0].key, 52)
+
+            lazy = AVLTree.load(path, lazy=True)
+            lazy.finger_insert_from(lazy.search(10)[0], 151, "151")
+
+        self.assertEqual([k for k, _ in left.avl_to_array()], list(range(0, 100, 2)))
+        self.assertEqual([k for k, _ in right.avl_to_array()], list(range(102, 200, 2)))
+        self.assertTrue(self.verify_avl_properties(left))
+        self.assertTrue(self.verify_avl_properties(right))
+        self.assertEqual([k for k, _ in lazy.avl_to_array()], sorted(list(range(0, 200, 2)) + [151]))
+        self.assertEqual(lazy.search(151)[0].key, 151)
+
+    def test_counting_observer(self):
+        """Test that the observer counts match the returned statistics"""
+        observer = CountingObserver()
+        self.tree.set_observer(observer)
+        total_e = total_h = 0
+        keys = list(range(500))
+        random.shuffle(keys)
+        for k in keys:
+            _, e, h = self.tree.finger_insert(k, str(k))
+            total_e += e
+            total_h += h
+        self.assertEqual((observer.inserts, observer.insert_arcs, observer.promotions), (500, total_e, total_h))
+        self.assertGreater(sum(observer.rotations.values()), 0)
+
+        search_arcs = sum(self.tree.search(k)[1] + self.tree.finger_search(k)[1] for k in range(-5, 505))
+        self.assertEqual((observer.searches, observer.search_arcs), (2 * 510, search_arcs))
+
+        left, right = self.tree.split(self.tree.search(250)[0])
+        self.assertEqual(observer.splits, 1)
+        self.assertGreater(observer.split_pieces, 0)
+        left.join(right, 250, "250")
+        self.assertEqual(observer.joins, 1)
+        self.assertLessEqual(observer.join_height_difference, 2)
+
+        observer.reset()
+        self.tree.set_observer(None)
+        self.tree.insert(1000, "1000")
+        self.assertEqual(observer.inserts, 0)
+
+    def test_observer_rotation_kinds(self):
+        """Test that every rotation kind is reported"""
+        kinds = []
+
+        class RotationObserver(AVLTreeObserver):
+            def on_rotation(self, kind):
+                kinds.append(kind)
+
+        for keys, kind in [([1, 2, 3], "left"), ([3, 2, 1], "right"), ([1, 3, 2], "right_left"), ([3, 1, 2], "left_right")]:
+            tree = AVLTree()
+            tree.set_observer(RotationObserver())
+            for k in keys:
+                tree.insert(k, str(k))
+            self.assertEqual(kinds.pop(), kind)
+        self.assertEqual(kinds, [])
+
+    def test_split_off_trees_inherit_observer(self):
+        """Test that every tree split off a tree has its observer, also at the edges"""
+        observer = CountingObserver()
+        for key in [-1, 50, 100, 1000]:
+            tree = AVLTree.from_sorted((k, str(k)) for k in range(0, 200, 2))
+            tree.set_observer(observer)
+            left, right = tree.split_at_key(key)
+            self.assertIs(left._observer, observer)
+            self.assertIs(right._observer, observer)
+            self.assertEqual(left.size() + right.size(), 100)
+            self.assertTrue(self.verify_avl_properties(left))
+            self.assertTrue(self.verify_avl_properties(right))
+
+        self.assertIs(tree.extract_range(5, 1)._observer, observer)
+        self.assertIs(AVLTree().split_at_key(3)[0]._observer, None)
+
+
+class ArrayAVLTreeTester(unittest.TestCase):
+    """Tests for the array-backed engine, checked against AVLTree"""
+
+    def setUp(self):
+        self.tree = ArrayAVLTree()
+
+    def verify_avl_properties(self, tree):
+        """Verify BST order, heights, balance factors, parent pointers and size"""
+        keys = [k for k, _ in tree.avl_to_array()]
+        if keys != sorted(keys) or tree.size() != len(keys):
+            return False
+        return self._check_node_properties(tree.get_root(), None)
+
+    def _check_node_properties(self, node, parent):
+        if node is None or not node.is_real_node():
+            return True
+        if node.parent != parent:
+            return False
+        left_h, right_h = node.left.height, node.right.height
+        if node.height != 1 + max(left_h, right_h) or abs(left_h - right_h) > 1:
+            return False
+        return self._check_node_properties(node.left, node) and self._check_node_properties(node.right, node)
+
+    def test_factory_engines(self):
+        """Test that the factory returns both engines"""
+        self.assertIsInstance(create_tree(), AVLTree)
+        self.assertIsInstance(create_tree("array"), ArrayAVLTree)
+        with self.assertRaises(ValueError):
+            create_tree("btree")
+
+    def test_same_statistics_as_avltree(self):
+        """Test that insert and search report the same e, h and arcs as AVLTree"""
+        keys = list(range(300))
+        random.shuffle(keys)
+        pointer_tree = AVLTree()
+        for k in keys:
+            self.assertEqual(self.tree.insert(k, str(k))[1:], pointer_tree.insert(k, str(k))[1:])
+        for k in range(-1, 301):
+            self.assertEqual(self.tree.search(k)[1], pointer_tree.search(k)[1])
+            self.assertEqual(self.tree.finger_search(k)[1], pointer_tree.finger_search(k)[1])
+
+        pointer_tree = AVLTree()
+        tree = ArrayAVLTree()
+        for k in keys:
+            self.assertEqual(tree.finger_insert(k, str(k))[1:], pointer_tree.finger_insert(k, str(k))[1:])
+        self.assertTrue(self.verify_avl_properties(tree))
+
+    def test_delete_reuses_slots(self):
+        """Test delete, max tracking and free slot reuse"""
+        for k in range(1, 101):
+            self.tree.insert(k, str(k))
+        for k in range(100, 50, -1):
+            self.tree.delete(self.tree.search(k)[0])
+            self.assertTrue(self.verify_avl_properties(self.tree))
+        self.assertEqual(self.tree.max_node().key, 50)
+        self.assertEqual(self.tree.size(), 50)
+
+        columns = len(self.tree._store.keys)
+        for k in range(1000, 1050):
+            self.tree.insert(k, str(k))
+        self.assertEqual(len(self.tree._store.keys), columns)
+        self.assertEqual(self.tree.max_node().key, 1049)
+
+    def test_split_and_join(self):
+        """Test split sizes and max nodes, and joining the parts back"""
+        keys = list(range(1, 200))
+        random.shuffle(keys)
+        for k in keys:
+            self.tree.insert(k, str(k))
+
+        left, right = self.tree.split(self.tree.search(77)[0])
+        self.assertTrue(self.verify_avl_properties(left))
+        self.assertTrue(self.verify_avl_properties(right))
+        self.assertEqual([k for k, _ in left.avl_to_array()], list(range(1, 77)))
+        self.assertEqual([k for k, _ in right.avl_to_array()], list(range(78, 200)))
+        self.assertEqual((left.max_node().key, right.max_node().key), (76, 199))
+
+        left.join(right, 77, "77")
+        self.assertTrue(self.verify_avl_properties(left))
+        self.assertEqual(left.size(), 199)
+
+        other = ArrayAVLTree()
+        for k in range(500, 520):
+            other.insert(k, str(k))
+        left.join(other, 300, "300")
+        self.assertTrue(self.verify_avl_properties(left))
+        self.assertEqual(left.max_node().key, 519)
+
+
+class PersistentAVLTreeTester(unittest.TestCase):
+    """Tests for the path-copying persistent tree"""
+
+    def setUp(self):
+        self.tree = PersistentAVLTree()
+
+    def verify_avl_properties(self, tree):
+        """Verify BST order, heights, balance factors and sizes"""
+        keys = [k for k, _ in tree.avl_to_array()]
+        if keys != sorted(keys) or tree.size() != len(keys):
+            return False
+        return self._check_node_properties(tree.get_root())
+
+    def _check_node_properties(self, node):
+        if node is None:
+            return True
+        left_h = node.left.height if node.left is not None else -1
+        right_h = node.right.height if node.right is not None else -1
+        left_size = node.left.size if node.left is not None else 0
+        right_size = node.right.size if node.right is not None else 0
+        if node.height != 1 + max(left_h, right_h) or abs(left_h - right_h) > 1:
+            return False
+        if node.size != 1 + left_size + right_size:
+            return False
+        return self._check_node_properties(node.left) and self._check_node_properties(node.right)
+
+    def test_snapshots_are_unchanged_by_later_writes(self):
+        """Test that a snapshot keeps its version while the tree keeps changing"""
+        keys = list(range(200))
+        random.shuffle(keys)
+        for k in keys[:100]:
+            self.tree.insert(k, str(k))
+        snapshot = self.tree.snapshot()
+        before = snapshot.avl_to_array()
+
+        for k in keys[100:]:
+            self.tree.insert(k, str(k))
+        for k in keys[:50]:
+            self.assertTrue(self.tree.delete(k))
+        self.assertFalse(self.tree.delete(-1))
+        self.tree.insert(keys[60], "new value")
+
+        self.assertEqual(snapshot.avl_to_array(), before)
+        self.assertTrue(self.verify_avl_properties(snapshot))
+        self.assertTrue(self.verify_avl_properties(self.tree))
+        self.assertEqual(self.tree.size(), 150)
+        self.assertEqual(self.tree.search(keys[60])[0].value, "new value")
+        self.assertEqual(snapshot.search(keys[60])[0].value, str(keys[60]))
+        self.assertIsNone(self.tree.search(keys[0])[0])
+
+    def test_insert_copies_only_the_path(self):
+        """Test that an insert shares every subtree off the search path"""
+        for k in range(1023):
+            self.tree.insert(k, str(k))
+        snapshot = self.tree.snapshot()
+        self.tree.insert(2000, "2000")
+
+        old_root, new_root = snapshot.get_root(), self.tree.get_root()
+        self.assertIsNot(old_root, new_root)
+        self.assertIs(old_root.left, new_root.left)
+        self.assertEqual((self.tree.max_node().key, snapshot.max_node().key), (2000, 1022))
+        self.assertEqual(self.tree.min_node().key, 0)
+
+    def test_split_and_join(self):
+        """Test split by present and absent keys and joining the parts back"""
+        for k in range(0, 300, 2):
+            self.tree.insert(k, str(k))
+        for split_key in [-1, 0, 77, 150, 298, 301]:
+            left, right = self.tree.split(split_key)
+            self.assertTrue(self.verify_avl_properties(left))
+            self.assertTrue(self.verify_avl_properties(right))
+            self.assertEqual([k for k, _ in left.avl_to_array()], [k for k in range(0, 300, 2) if k < split_key])
+            self.assertEqual([k for k, _ in right.avl_to_array()], [k for k in range(0, 300, 2) if k > split_key])
+            self.assertEqual(self.tree.size(), 150)
+
+        left, right = self.tree.split(100)
+        right.join(left, 100, "joined")
+        self.assertTrue(self.verify_avl_properties(right))
+        self.assertEqual(right.size(), 150)
+        self.assertEqual(right.search(100)[0].value, "joined")
+
+
+class ConcurrentAVLTreeTester(unittest.TestCase):
+    """Stress tests for the thread-safe wrapper"""
+
+    def test_readers_see_consistent_versions_under_writes(self):
+        """Test that readers only ever see whole, balanced versions while writers run"""
+        tree = ConcurrentAVLTree()
+        checker = PersistentAVLTreeTester()
+        writers_done = threading.Event()
+        errors = []
+
+        def write(offset):
+            for k in range(offset, 2000, 4):
+                tree.insert(k, str(k))
+            for k in range(offset, 1000, 4):
+                tree.delete(k)
+
+        def read():
+            while not writers_done.is_set():
+                snapshot = tree.snapshot()
+                if not checker.verify_avl_properties(snapshot):
+                    errors.append("unbalanced version")
+                # every version of a pair insert applied by apply holds both keys or neither
+                if (snapshot.search(-1)[0] is None) != (snapshot.search(-2)[0] is None):
+                    errors.append("torn version")
+
+        def write_pairs():
+            for _ in range(200):
+                tree.apply(lambda version: (version.insert(-1, ""), version.insert(-2, "")))
+                tree.apply(lambda version: (version.delete(-1), version.delete(-2)))
+
+        readers = [threading.Thread(target=read) for _ in range(3)]
+        writers = [threading.Thread(target=write, args=(offset,)) for offset in range(4)]
+        writers.append(threading.Thread(target=write_pairs))
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        writers_done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual([k for k, _ in tree.avl_to_array()], list(range(1000, 2000)))
+        self.assertEqual(tree.size(), 1000)
+        self.assertEqual(tree.search(1500)[0].value, "1500")
+
+
+class DurableAVLTreeTester(unittest.TestCase):
+    """Tests for the write-ahead logged tree"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def test_recovery_replays_log_after_checkpoint(self):
+        """Test that reopening restores every synced change across checkpoints"""
+        tree = DurableAVLTree(self.directory, group_size=8, checkpoint_every=150)
+        expected = {}
+        keys = random.sample(range(10_000), 400)
+        for i, k in enumerate(keys):
+            if i % 2 == 0:
+                tree.insert(k, str(k))
+            else:
+                tree.finger_insert(k, None)
+            expected[k] = str(k) if i % 2 == 0 else None
+        for k in keys[:100]:
+            self.assertIsNotNone(tree.delete_key(k))
+            del expected[k]
+        self.assertIsNone(tree.delete_key(-1))
+        tree.join(AVLTree.from_sorted((k, str(k)) for k in range(20_000, 20_010)), 15_000, "separator")
+        expected.update((k, str(k)) for k in range(20_000, 20_010))
+        expected[15_000] = "separator"
+        tree.close()
+
+        recovered = DurableAVLTree(self.directory)
+        self.assertEqual(recovered.tree.avl_to_array(), sorted(expected.items()))
+        self.assertTrue(AVLTreeTester().verify_avl_properties(recovered.tree))
+        self.assertEqual(len([name for name in os.listdir(self.directory) if name.startswith("checkpoint")]), 1)
+
+        left, right = recovered.split(recovered.tree.search(15_000)[0])
+        self.assertEqual(left.size() + right.size(), len(expected) - 1)
+        recovered.insert(1, "1")
+        recovered.close()
+        self.assertEqual(DurableAVLTree(self.directory).tree.avl_to_array(), [(1, "1")])
+
+    def test_recovery_ignores_torn_tail(self):
+        """Test that a half-written record at the end of the log is dropped"""
+        tree = DurableAVLTree(self.directory, group_size=1)
+        for k in range(50):
+            tree.insert(k, str(k))
+        tree._log.write(b"\x10\x00\x00\x00\x00\x00\x00\x00torn")
+        tree._log.close()
+
+        recovered = DurableAVLTree(self.directory)
+        self.assertEqual([k for k, _ in recovered.tree.avl_to_array()], list(range(50)))
+        recovered.insert(50, "50")
+        recovered.close()
+        self.assertEqual(DurableAVLTree(self.directory).tree.size(), 51)
+
+    def test_join_is_replayed_whole(self):
+        """Test that a join straddling a group commit is recovered completely or not at all"""
+        tree = DurableAVLTree(self.directory, group_size=3)
+        for k in range(50):
+            tree.insert(k, str(k))
+        # 50 inserts leave 2 records pending, the join fills the group and is synced with them
+        tree.join(AVLTree.from_sorted([(61, "61"), (62, "62")]), 60, "60")
+        synced_end = tree._log.tell()
+        tree.insert(70, "70")
+        tree._log.close()  # crash: the pending insert is lost
+
+        recovered = DurableAVLTree(self.directory)
+        self.assertEqual([k for k, _ in recovered.tree.avl_to_array()], list(range(50)) + [60, 61, 62])
+        recovered._log.close()
+
+        # a log cut inside the join record drops the whole join
+        with open(os.path.join(self.directory, "wal-00000000.log"), "r+b") as f:
+            f.truncate(synced_end - 5)
+        recovered = DurableAVLTree(self.directory)
+        self.assertEqual([k for k, _ in recovered.tree.avl_to_array()], list(range(50)))
+        recovered.close()
+
+
+class InstrumentedAVLTreeTester(unittest.TestCase):
+    """Tests for the latency-recording tree"""
+
+    def test_histogram_buckets_and_percentiles(self):
+        """Test that every latency falls in its bucket and percentiles are bucket bounds"""
+        for ns in list(range(64)) + [random.randrange(1, 10**12) for _ in range(1000)]:
+            index = bucket_of(ns)
+            self.assertLessEqual(ns, bucket_upper_bound(index))
+            self.assertTrue(index == 0 or bucket_upper_bound(index - 1) < ns)
+
+        histogram = LatencyHistogram()
+        for ns in range(1, 10_001):
+            histogram.record(ns)
+        self.assertEqual(histogram.percentile(0.5), bucket_upper_bound(bucket_of(5000)))
+        self.assertEqual(histogram.percentile(1.0), 10_000)
+        self.assertEqual((histogram.count, histogram.total), (10_000, 10_000 * 10_001 // 2))
+        self.assertEqual(LatencyHistogram().percentile(0.99), 0)
+
+    def test_metrics_and_prometheus_export(self):
+        """Test the metrics snapshot and the Prometheus text it is exported as"""
+        tree = InstrumentedAVLTree()
+        observer = CountingObserver()
+        tree.set_observer(observer)
+        for k in range(100):
+            tree.insert(k, str(k))
+        for k in range(50):
+            tree.delete_key(k)
+        left, right = tree.split(tree.search(75)[0])
+
+        metrics = tree.metrics()
+        operations = metrics["operations"]
+        self.assertEqual(operations["insert"]["count"], 100)
+        self.assertEqual(operations["search"]["count"], 1)
+        self.assertEqual((operations["delete"]["count"], operations["split"]["count"]), (50, 1))
+        self.assertEqual(operations["join"]["count"], 0)
+        self.assertLessEqual(operations["insert"]["p50"], operations["insert"]["p999"])
+        self.assertEqual(metrics["rotations"], observer.rotations)
+        self.assertGreater(metrics["rotations"]["left"], 0)
+        self.assertEqual(metrics["size"], tree.size())
+
+        path = os.path.join(tempfile.mkdtemp(), "avltree.prom")
+        tree.export_prometheus(path)
+        with open(path) as f:
+            text = f.read()
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+        self.assertIn('avltree_operation_latency_seconds_bucket{operation="insert",le="+Inf"} 100', text)
+        self.assertIn('avltree_operation_latency_seconds_count{operation="delete"} 50', text)
+        self.assertIn(f"avltree_height {metrics['height']}", text)
+        self.assertIn(f'avltree_rotations_total{{kind="left"}} {metrics["rotations"]["left"]}', text)
+
+        sampled = InstrumentedAVLTree(sample_every=4)
+        for k in range(100):
+            sampled.insert(k, None)
+        self.assertEqual(sampled.metrics()["operations"]["insert"]["count"], 100)
+        self.assertEqual(sampled.latency["insert"].count, 25)
+
+        tree = InstrumentedAVLTree()
+        for k in range(100):
+            tree.insert(k, None)
+        left, right = tree.split(tree.search(50)[0])
+        left.insert(50, None)
+        right.search(75)
+        upper, _ = right.split_at_key(1000)
+        self.assertIsInstance(upper, InstrumentedAVLTree)
+        upper.insert(1000, None)
+        operations = left.metrics()["operations"]
+        self.assertEqual((operations["insert"]["count"], operations["search"]["count"]), (102, 2))
+        self.assertIs(right.latency, tree.latency)
+        self.assertIs(upper.rotations, tree.rotations)
+
+        keywords = InstrumentedAVLTree()
+        keywords.insert(key=1, val="a")
+        self.assertEqual(keywords.search(key=1)[0].value, "a")
+        self.assertEqual(keywords.metrics()["operations"]["insert"]["count"], 1)
+
+    def test_prometheus_buckets_are_stable(self):
+        """Test that every export has the same buckets, empty ones included"""
+        tree = InstrumentedAVLTree()
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "avltree.prom")
+
+        def bucket_lines():
+            tree.export_prometheus(path)
+            with open(path) as f:
+                return [line.rstrip("\n").rsplit(" ", 1) for line in f if line.startswith("avltree_operation_latency_seconds_bucket")]
+
+        before = bucket_lines()
+        for k in range(200):
+            tree.insert(k, None)
+        after = bucket_lines()
+        os.remove(path)
+        os.rmdir(directory)
+
+        self.assertEqual([label for label, _ in before], [label for label, _ in after])
+        self.assertEqual(len(after), 7 * (len(PROMETHEUS_BUCKETS) + 1))
+        self.assertEqual({count for _, count in before}, {"0"})
+        insert_counts = [int(count) for label, count in after if 'operation="insert"' in label]
+        self.assertEqual(insert_counts, sorted(insert_counts))
+        self.assertEqual(insert_counts[-1], 200)
+
+        histogram = LatencyHistogram()
+        latencies = [random.randint(1, 10**7) for _ in range(1000)] + list(PROMETHEUS_BUCKETS[:10])
+        for ns in latencies:
+            histogram.record(ns)
+        self.assertEqual(histogram.counts_at_most(PROMETHEUS_BUCKETS), [sum(ns <= bound for ns in latencies) for bound in PROMETHEUS_BUCKETS])
+
+
+def quadratic_inversions(arr):
+    """counts the pairs j < k with arr[j] > arr[k] by comparing every pair"""
+    return sum(arr[j] > arr[k] for j in range(len(arr)) for k in range(j + 1, len(arr)))
+
+
+@unittest.skipUnless(HAS_TABULATE, "research_tester needs tabulate")
+class InversionCountTester(unittest.TestCase):
+    """Tests for the inversion counters of research_tester against a quadratic count"""
+
+    def random_arrays(self):
+        """Yield random permutations of every small length and a few larger ones"""
+        for n in list(range(10)) + [31, 64, 100, 257]:
+            arr = list(range(1, n + 1))
+            random.shuffle(arr)
+            yield arr
+
+    def test_count_inversions(self):
+        """Test the merge sort count against the quadratic count"""
+        from research_tester import count_inversions
+        for arr in self.random_arrays():
+            self.assertEqual(count_inversions(arr), quadratic_inversions(arr))
+        self.assertEqual(count_inversions(list(range(100, 0, -1))), 100 * 99 // 2)
+
+    def test_count_inversions_tree(self):
+        """Test the AVLTree rank count against the quadratic count"""
+        from research_tester import count_inversions_tree
+        for arr in self.random_arrays():
+            self.assertEqual(count_inversions_tree(arr), quadratic_inversions(arr))
+
+    @unittest.skipUnless(HAS_NUMPY, "numpy is not installed")
+    def test_count_inversions_numpy(self):
+        """Test the vectorized NumPy count against the quadratic count"""
+        from research_tester import count_inversions_numpy
+        for arr in self.random_arrays():
+            self.assertEqual(count_inversions_numpy(arr), quadratic_inversions(arr))
+        self.assertEqual(count_inversions_numpy([-5, 3, -7, 10**9, 0]), quadratic_inversions([-5, 3, -7, 10**9, 0]))
+
 
 def run_tests():
     """Run all tests and display results"""
@@ -986,6 +2081,12 @@ def run_tests():
     # Run tests
     loader = unittest.TestLoader()
     suite = loader.loadTestsFromTestCase(AVLTreeTester)
+    suite.addTests(loader.loadTestsFromTestCase(ArrayAVLTreeTester))
+    suite.addTests(loader.loadTestsFromTestCase(PersistentAVLTreeTester))
+    suite.addTests(loader.loadTestsFromTestCase(ConcurrentAVLTreeTester))
+    suite.addTests(loader.loadTestsFromTestCase(DurableAVLTreeTester))
+    suite.addTests(loader.loadTestsFromTestCase(InstrumentedAVLTreeTester))
+    suite.addTests(loader.loadTestsFromTestCase(InversionCountTester))
     runner = unittest.TextTestRunner(verbosity=2)
     result = runner.run(suite)
 
@@ -0,0 +1,50 @@
+"""
+Insert throughput benchmark.
+
+Compares the instrumented inserts (insert, finger_insert), which return the
+e and h statistics, with the statistics-free fast paths (insert_fast,
+finger_insert_fast) on ascending and random keys.
+
+Run: python3 insert_benchmark.py [n]
+"""
+
+import random
+import sys
+import time
+
+from AVLTree import AVLTree
+
+N = 200_000
+REPEAT = 3
+
+
+def best_time(method_name, keys):
+    """returns the best wall time of inserting keys into a fresh tree with the given method"""
+    best = None
+    for _ in range(REPEAT):
+        tree = AVLTree()
+        insert = getattr(tree, method_name)
+        start = time.perf_counter()
+        for key in keys:
+            insert(key, None)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(n):
+    ascending = list(range(n))
+    shuffled = ascending[:]
+    random.shuffle(shuffled)
+
+    print(f"{'keys':>10} {'method':>20} {'ops/sec':>12} {'speedup':>8}")
+    for label, keys in [("ascending", ascending), ("random", shuffled)]:
+        for instrumented, fast in [("insert", "insert_fast"), ("finger_insert", "finger_insert_fast")]:
+            slow_time = best_time(instrumented, keys)
+            fast_time = best_time(fast, keys)
+            print(f"{label:>10} {instrumented:>20} {n / slow_time:>12,.0f}")
+            print(f"{label:>10} {fast:>20} {n / fast_time:>12,.0f} {slow_time / fast_time:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else N)
@@ -0,0 +1,85 @@
+"""
+Memory benchmark for AVLNode.
+
+Builds trees with AVLTree.insert and reports the number of bytes allocated
+per node, once with the slotted AVLNode and once with a node class that
+has the old __dict__ based layout. The array-backed engine (ArrayAVLTree)
+is measured the same way for comparison.
+
+Run: python3 memory_benchmark.py [n ...]
+"""
+
+import random
+import sys
+import tracemalloc
+
+import AVLTree as avl_module
+from AVLTree import AVLTree, AVLNode
+from ArrayAVLTree import ArrayAVLTree
+
+SIZES = [10_000, 100_000]
+
+
+class LegacyAVLNode(object):
+    """AVLNode as it was before __slots__, used as the "before" layout"""
+
+    def __init__(self, key=None, value=None):
+        self.key = key
+        self.value = value
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.height = -1
+        self.size = 0
+
+    def is_real_node(self):
+        return self.left is not None and self.right is not None and self.height != -1
+
+
+def bytes_per_node(n, node_class):
+    """builds a tree of n random keys with insert and returns the traced bytes per node"""
+    keys = list(range(n))
+    random.shuffle(keys)
+    values = [str(k) for k in keys]
+
+    avl_module.AVLNode = node_class
+    try:
+        tracemalloc.start()
+        tree = AVLTree()
+        for key, val in zip(keys, values):
+            tree.insert(key, val)
+        used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        avl_module.AVLNode = AVLNode
+
+    return used / n
+
+
+def array_bytes_per_node(n):
+    """builds an ArrayAVLTree of n random keys with insert and returns the traced bytes per node"""
+    keys = list(range(n))
+    random.shuffle(keys)
+    values = [str(k) for k in keys]
+
+    tracemalloc.start()
+    tree = ArrayAVLTree()
+    for key, val in zip(keys, values):
+        tree.insert(key, val)
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return used / n
+
+
+def main(sizes):
+    print(f"{'n':>10} {'before (B/node)':>16} {'after (B/node)':>15} {'saved':>7} {'array (B/node)':>15}")
+    for n in sizes:
+        before = bytes_per_node(n, LegacyAVLNode)
+        after = bytes_per_node(n, AVLNode)
+        array_engine = array_bytes_per_node(n)
+        print(f"{n:>10} {before:>16.1f} {after:>15.1f} {1 - after / before:>7.1%} {array_engine:>15.1f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,63 @@
+"""
+Overhead benchmark for InstrumentedAVLTree.
+
+Runs the same random inserts, searches and deletes on an AVLTree and on
+InstrumentedAVLTrees with several sample_every values, reports the slowdown
+of each instrumented tree, then the metrics() percentiles of the one that
+times every call.
+
+Run: python3 metrics_benchmark.py [n]
+"""
+
+import random
+import sys
+import time
+
+from AVLTree import AVLTree
+from InstrumentedAVLTree import InstrumentedAVLTree
+
+N = 200_000
+REPEAT = 3
+SAMPLE_EVERY = [1, 8, 64]
+
+
+def workload_time(make_tree, keys):
+    """returns the best wall time of inserting, searching and deleting keys, and the last tree"""
+    best = None
+    for _ in range(REPEAT):
+        tree = make_tree()
+        start = time.perf_counter()
+        for key in keys:
+            tree.insert(key, None)
+        for key in keys:
+            tree.search(key)
+        for key in keys:
+            tree.delete_key(key)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, tree
+
+
+def main(n):
+    keys = list(range(n))
+    random.shuffle(keys)
+
+    plain_time, _ = workload_time(AVLTree, keys)
+    print(f"{'tree':>18} {'time (s)':>9} {'overhead':>9}")
+    print(f"{'AVLTree':>18} {plain_time:>9.3f}")
+    for sample_every in SAMPLE_EVERY:
+        instrumented_time, _ = workload_time(lambda: InstrumentedAVLTree(sample_every), keys)
+        print(f"{f'sample_every={sample_every}':>18} {instrumented_time:>9.3f} {instrumented_time / plain_time - 1:>+9.1%}")
+
+    _, tree = workload_time(InstrumentedAVLTree, keys)
+    print(f"\n{'operation':>14} {'count':>9} {'p50 (us)':>9} {'p99 (us)':>9} {'p999 (us)':>10}")
+    for operation, summary in tree.metrics()["operations"].items():
+        if summary["count"]:
+            print(
+                f"{operation:>14} {summary['count']:>9} {summary['p50'] * 1e6:>9.2f} "
+                f"{summary['p99'] * 1e6:>9.2f} {summary['p999'] * 1e6:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else N)
@@ -0,0 +1,80 @@
+"""
+Counts the rebalancing work of AVLTree on the research_tester workloads.
+
+Every array order from research_tester.TestType is inserted with
+finger_insert and then deleted key by key in random order. The script
+reports the average number of node height updates and rotations per insert
+and per delete.
+
+Run: python3 rebalance_counters.py [max_i]
+"""
+
+import random
+import sys
+
+from AVLTree import AVLTree
+from research_tester import N, TestType, generate_array
+
+MAX_I = 5
+
+
+class CountingAVLTree(AVLTree):
+    """AVLTree that counts height updates and rotations"""
+
+    def __init__(self):
+        super().__init__()
+        self.height_updates = 0
+        self.rotations = 0
+
+    def _refresh_node(self, node):
+        self.height_updates += 1
+        super()._refresh_node(node)
+
+    def left_rotation(self, criminal_node, child_node):
+        self.rotations += 1
+        super().left_rotation(criminal_node, child_node)
+
+    def right_rotation(self, criminal_node, child_node):
+        self.rotations += 1
+        super().right_rotation(criminal_node, child_node)
+
+    def right_then_left_rotation(self, criminal_node, child_node, grandchild_node):
+        self.rotations += 2
+        super().right_then_left_rotation(criminal_node, child_node, grandchild_node)
+
+    def left_then_right_rotation(self, criminal_node, child_node, grandchild_node):
+        self.rotations += 2
+        super().left_then_right_rotation(criminal_node, child_node, grandchild_node)
+
+
+def count(i, test_type):
+    """returns (height updates, rotations) per insert and per delete"""
+    tree = CountingAVLTree()
+    keys = list(generate_array(i, test_type))
+    for key in keys:
+        # promotions are height updates done inline by the insert walk
+        _, _, h = tree.finger_insert(key, None)
+        tree.height_updates += h
+    insert_counts = (tree.height_updates / len(keys), tree.rotations / len(keys))
+
+    tree.height_updates = tree.rotations = 0
+    random.shuffle(keys)
+    for key in keys:
+        tree.delete_key(key)
+    delete_counts = (tree.height_updates / len(keys), tree.rotations / len(keys))
+
+    return insert_counts, delete_counts
+
+
+def main(max_i):
+    print(f"{'test type':>24} {'n':>8} {'ins updates':>12} {'ins rot':>8} {'del updates':>12} {'del rot':>8}")
+    for test_type in TestType.to_list():
+        for i in range(1, max_i + 1):
+            (ins_updates, ins_rot), (del_updates, del_rot) = count(i, test_type)
+            print(
+                f"{test_type:>24} {N * 2**i:>8} {ins_updates:>12.2f} {ins_rot:>8.2f} {del_updates:>12.2f} {del_rot:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else MAX_I)
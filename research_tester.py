@@ -1,6 +1,7 @@
+import math
 import random
 from tabulate import tabulate
-from AVLTree import AVLTree, AVLNode
+from AVLTree import AVLTree, AVLNode, CountingObserver
 
 N = 300
 I = 10
@@ -48,12 +49,75 @@ def generate_array(i, test_type=TestType.ORDERD_ARRAY, base=N):
 
 
 def count_reversals(i, test_type=TestType.ORDERD_ARRAY, base=N):
-    arr = list(generate_array(i, test_type))
+    return count_inversions(list(generate_array(i, test_type, base)))
+
+
+def count_inversions(arr):
+    """counts the pairs j < k with arr[j] > arr[k] with a bottom-up merge sort in O(n log n)"""
+    arr = list(arr)
+    n = len(arr)
+    buffer = [None] * n
     total_reversals = 0
-    for j in range(len(arr)):
-        for k in range(j + 1, len(arr)):
-            if arr[j] > arr[k]:
-                total_reversals += 1
+    width = 1
+    while width < n:
+        for start in range(0, n, 2 * width):
+            mid = min(start + width, n)
+            end = min(start + 2 * width, n)
+            j, k, out = start, mid, start
+            while j < mid and k < end:
+                if arr[k] < arr[j]:
+                    # arr[k] is smaller than every element left in the left run
+                    total_reversals += mid - j
+                    buffer[out] = arr[k]
+                    k += 1
+                else:
+                    buffer[out] = arr[j]
+                    j += 1
+                out += 1
+            buffer[out:end] = arr[j:mid] if j < mid else arr[k:end]
+        arr, buffer = buffer, arr
+        width *= 2
+    return total_reversals
+
+
+def count_inversions_tree(arr):
+    """counts inversions in O(n log n) by asking a rank-augmented AVLTree how many
+    earlier elements are larger than each element"""
+    tree = AVLTree()
+    total_reversals = 0
+    for num in arr:
+        total_reversals += tree.size() - tree.rank(num)
+        tree.insert_fast(num, None)
+    return total_reversals
+
+
+def count_inversions_numpy(arr):
+    """counts inversions with a bottom-up merge sort vectorized over whole levels in NumPy
+
+    At every level the runs are shifted apart by their pair index, so one searchsorted
+    over all left runs counts, for every element of a right run, the larger elements
+    of its left run.
+    """
+    import numpy as np
+
+    arr = np.asarray(arr, dtype=np.int64)
+    n = len(arr)
+    if n < 2:
+        return 0
+    arr = arr - arr.min()
+    span = int(arr.max()) + 1
+    positions = np.arange(n)
+    total_reversals = 0
+    width = 1
+    while width < n:
+        pair = positions // (2 * width)
+        shifted = arr + pair * span
+        is_left = (positions // width) % 2 == 0
+        lefts = shifted[is_left]
+        left_ends = np.searchsorted(pair[is_left], pair[~is_left], side="right")
+        total_reversals += int((left_ends - np.searchsorted(lefts, shifted[~is_left], side="right")).sum())
+        arr = np.sort(shifted) - pair * span
+        width *= 2
     return total_reversals
 
 
@@ -69,11 +133,11 @@ def part_1():
             for _ in range(repeat):
                 print(f"({_}) Running test {i} with array size {N} * 2 ** {i} = {N * 2 ** i}")
                 tree = AVLTree()
-                total_h = 0
+                observer = CountingObserver()
+                tree.set_observer(observer)
                 for num in generate_array(i, test_type):
-                    _, _, h = tree.finger_insert(num, str(num))
-                    total_h += h
-                results[test_type][i] += total_h
+                    tree.finger_insert(num, str(num))
+                results[test_type][i] += observer.promotions
             results[test_type][i] = results[test_type][i] // repeat
 
     # Prepare table data
@@ -95,7 +159,7 @@ def part_2():
         repeat = 1
         if TestType.is_random_test(test_type):
             repeat = REPEAT_COUNT
-        for i in range(1, I - 5 + 1):
+        for i in range(1, I + 1):
             results[test_type][i] = 0
             for _ in range(repeat):
                 print(f"({_}) Running test {i} with array size {N} * 2 ** {i} = {N * 2 ** i}")
@@ -107,7 +171,7 @@ def part_2():
     headers = ["i", "n"] + test_types
 
     table_data = []
-    for i in range(1, I - 5 + 1):
+    for i in range(1, I + 1):
         row = [i, N * 2**i] + [results[test_type][i] for test_type in test_types]
         table_data.append(row)
 
@@ -126,11 +190,11 @@ def part_3():
             for _ in range(repeat):
                 print(f"({_}) Running test {i} with array size {N} * 2 ** {i} = {N * 2 ** i}")
                 tree = AVLTree()
-                total_e = 0
+                observer = CountingObserver()
+                tree.set_observer(observer)
                 for num in generate_array(i, test_type):
-                    _, e, _ = tree.finger_insert(num, str(num))
-                    total_e += e
-                results[test_type][i] += total_e
+                    tree.finger_insert(num, str(num))
+                results[test_type][i] += observer.insert_arcs
             results[test_type][i] = results[test_type][i] // repeat
 
     # Prepare table data
@@ -145,6 +209,30 @@ def part_3():
     print("\n" + tabulate(table_data, headers=headers, tablefmt="grid"))
 
 
+def part_4():
+    """cross-checks the finger_insert arcs of part 3 against the inversions of part 2
+
+    Inserting from the maximum, an element with d larger elements before it costs
+    O(log(d + 2)) arcs, so the total arcs should stay within a constant factor of
+    n * log2(2 + inversions / n). The table reports that ratio.
+    """
+    table_data = []
+    for test_type in TestType.to_list()[::-1]:
+        for i in range(1, I + 1):
+            arr = list(generate_array(i, test_type))
+            tree = AVLTree()
+            total_e = 0
+            for num in arr:
+                _, e, _ = tree.finger_insert(num, str(num))
+                total_e += e
+            reversals = count_inversions(arr)
+            bound = len(arr) * math.log2(2 + reversals / len(arr))
+            table_data.append([test_type, i, len(arr), reversals, total_e, round(total_e / bound, 3)])
+
+    headers = ["test type", "i", "n", "inversions", "arcs", "arcs / n log2(2 + inv/n)"]
+    print("\n" + tabulate(table_data, headers=headers, tablefmt="grid"))
+
+
 if __name__ == "__main__":
     tree = AVLTree()
     print(f"========= Running Part 1 Tests =========")
@@ -153,4 +241,6 @@ if __name__ == "__main__":
     part_2()
     print(f"\n========= Running Part 3 Tests =========")
     part_3()
+    print(f"\n========= Running Part 4 Tests =========")
+    part_4()
     print(f"\n========= All Tests Completed =========")
@@ -0,0 +1,55 @@
+"""
+Split and join scaling benchmark.
+
+Builds trees of growing size with AVLTree.from_sorted, then repeatedly
+splits at a random key and joins the two halves back with the same key.
+The time per split and per join should grow with log n, so the last
+column (microseconds per log2 n) stays roughly flat.
+
+Run: python3 split_join_benchmark.py [n ...]   (e.g. 10000000 for 10^7)
+"""
+
+import math
+import random
+import sys
+import time
+
+from AVLTree import AVLTree
+
+SIZES = [10**3, 10**4, 10**5, 10**6]
+ROUNDS = 2000
+
+
+def time_split_join(n, rounds):
+    """returns the average (split, join) time in seconds on a tree of n keys"""
+    tree = AVLTree.from_sorted((k, None) for k in range(n))
+    split_time = join_time = 0.0
+    for _ in range(rounds):
+        key = random.randrange(n)
+        node, _ = tree.search(key)
+
+        start = time.perf_counter()
+        left, right = tree.split(node)
+        split_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        left.join(right, key, None)
+        join_time += time.perf_counter() - start
+
+        tree = left
+    return split_time / rounds, join_time / rounds
+
+
+def main(sizes):
+    print(f"{'n':>10} {'split (us)':>11} {'join (us)':>10} {'split/log n':>12} {'join/log n':>11}")
+    for n in sizes:
+        split_time, join_time = time_split_join(n, ROUNDS)
+        log_n = math.log2(n)
+        print(
+            f"{n:>10} {split_time * 1e6:>11.2f} {join_time * 1e6:>10.2f} "
+            f"{split_time * 1e6 / log_n:>12.3f} {join_time * 1e6 / log_n:>11.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,70 @@
+"""
+Durability benchmark for DurableAVLTree.
+
+Reports inserts/sec of a plain AVLTree and of a DurableAVLTree with several
+group commit sizes, then the recovery time of a DurableAVLTree as a
+function of the number of records in its log (no checkpoint).
+
+Run: python3 wal_benchmark.py [n]
+"""
+
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from AVLTree import AVLTree
+from DurableAVLTree import DurableAVLTree
+
+N = 20_000
+GROUP_SIZES = [1, 16, 64, 1024]
+LOG_LENGTHS = [1_000, 10_000, 100_000]
+
+
+def inserts_per_second(n, group_size):
+    """returns the inserts/sec of n random keys, group_size None for a plain AVLTree"""
+    keys = random.sample(range(10 * n), n)
+    directory = tempfile.mkdtemp()
+    try:
+        tree = AVLTree() if group_size is None else DurableAVLTree(directory, group_size=group_size)
+        start = time.perf_counter()
+        for key in keys:
+            tree.insert(key, "value")
+        if group_size is not None:
+            tree.close()
+        return n / (time.perf_counter() - start)
+    finally:
+        shutil.rmtree(directory)
+
+
+def recovery_seconds(log_length):
+    """returns the time to reopen a DurableAVLTree whose log has log_length records"""
+    directory = tempfile.mkdtemp()
+    try:
+        tree = DurableAVLTree(directory, group_size=1024)
+        for key in random.sample(range(10 * log_length), log_length):
+            tree.insert(key, "value")
+        tree.close()
+
+        start = time.perf_counter()
+        DurableAVLTree(directory).close()
+        return time.perf_counter() - start
+    finally:
+        shutil.rmtree(directory)
+
+
+def main(n):
+    print(f"{'durability':>16} {'inserts/sec':>12}")
+    print(f"{'off':>16} {inserts_per_second(n, None):>12,.0f}")
+    for group_size in GROUP_SIZES:
+        print(f"{f'group of {group_size}':>16} {inserts_per_second(n, group_size):>12,.0f}")
+
+    print()
+    print(f"{'log records':>12} {'recovery (s)':>13}")
+    for log_length in LOG_LENGTHS:
+        print(f"{log_length:>12} {recovery_seconds(log_length):>13.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else N)